@@ -1,9 +1,24 @@
+import os
+import html
+import logging
 import streamlit as st
 from dotenv import load_dotenv
-from utils import generate_embedding, insert_embeddings, collection, get_rag_response
+from utils import generate_embedding, insert_embeddings, get_rag_response, get_similar_items
+from resilience import get_metrics
+from clip_server import clip_service_available, clip_url, is_browser_url, is_upload_url
+from warmup import SUGGESTED_QUERIES, get_precomputed_response, log_query
+from services import start_services
 
 load_dotenv()
 
+# Token usage, warm-up and upstream warnings are reported through logging
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+
+start_services()
+
 st.markdown("""
 <style>
     .main {
@@ -86,6 +101,21 @@ def create_video_embed(video_url, start_time=0, end_time=0):
                     allowfullscreen>
                 </iframe>
             """
+        elif clip_service_available() and end_time and (is_browser_url(video_url) or is_upload_url(video_url)):
+            # Only the matched segment is fetched, from the local clip cache
+            return f"""
+                <video 
+                    width="100%" 
+                    height="315" 
+                    controls 
+                    preload="metadata">
+                    <source src="{html.escape(clip_url(video_url, start_time, end_time))}" type="video/mp4">
+                    Your browser does not support the video tag.
+                </video>
+            """
+        elif not is_browser_url(video_url):
+            # Uploaded videos are only served as clips; their server path never reaches the page
+            return "<p>Video preview unavailable.</p>"
         else:
             return f"""
                 <video 
@@ -109,73 +139,106 @@ def create_video_embed(video_url, start_time=0, end_time=0):
         return f"<p>Error creating video embed for URL: {video_url}</p>"
 
 
-def render_product_details(source):
+def build_card_html(is_video, title, similarity, description, product_id, link, start_time, end_time):
+    # Determine section title and button text
+    section_title = "📹 Video Segment" if is_video else "📝 Product Details"
+    
+    store_link_html = ""
+    if link and isinstance(link, str) and len(link.strip()) > 0:
+        store_link_html = f"""
+            <div style="margin-top: 1rem;">
+                <a href="{link}" 
+                   target="_blank" 
+                   style="
+                       display: inline-block;
+                       background-color: #81E831;
+                       color: white;
+                       padding: 10px 20px;
+                       border-radius: 20px;
+                       text-decoration: none;
+                       font-weight: 500;
+                       margin-top: 10px;
+                       border: none;
+                       cursor: pointer;
+                   ">
+                    View on Store
+                </a>
+            </div>
+        """
+    # Product Card
+    card_html = f"""
+        <div style="background-color: white; padding: 1.5rem; border-radius: 10px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
+            <h3 style="color: #333; margin-bottom: 1rem;">{section_title}</h3>
+            <h4 style="color: #81E831;">{title}</h4>
+            <div style="margin: 1rem 0;">
+                <div style="background: linear-gradient(90deg, #81E831 {similarity}%, #f1f1f1 {similarity}%); 
+                     height: 6px; border-radius: 3px; margin-bottom: 0.5rem;"></div>
+                <p style="color: #666;">Similarity Score: {similarity}%</p>
+            </div>
+            <p style="color: #333; font-size: 1.1em;">{description}</p>
+            <p style="color: #666;">Product ID: {product_id}</p>
+            {f'<p style="color: #666;">Segment Time: {start_time:.1f}s - {end_time:.1f}s</p>' if is_video else ''}
+        </div>
+    """
+    return card_html, store_link_html
+
+
+# Everything a result card shows, built once when the answer arrives and stored with the message,
+# so reruns of the chat history only re-emit markup
+def prepare_card(source):
+    is_video = source.get("type") == "video"
+    card_html, store_link_html = build_card_html(
+        is_video,
+        source.get('title', 'No Title'),
+        source.get('similarity', 0),
+        source.get('description', 'No description available'),
+        source.get('product_id', 'N/A'),
+        source.get('link'),
+        source.get('start_time', 0),
+        source.get('end_time', 0)
+    )
+    player_html = None
+    if is_video and source.get('video_url'):
+        player_html = create_video_embed(source['video_url'], source.get('start_time', 0), source.get('end_time', 0))
+    return {
+        "type": source.get("type"),
+        "card_html": card_html,
+        "store_link_html": store_link_html,
+        # Related products come from the precomputed kNN graph, no extra search
+        "similar": get_similar_items(source.get('product_id')),
+        "player_html": player_html,
+        "video_url": source.get('video_url')
+    }
+
+
+# A copy of the response carrying its prepared cards; precomputed answers are shared, so not mutated
+def with_cards(response_data):
+    metadata = response_data.get("metadata") or {}
+    return dict(response_data, cards=[prepare_card(source) for source in metadata.get("sources") or []])
+
+
+def render_product_details(card):
     with st.container():
         col1, col2 = st.columns([2, 1])
         
         with col1:
+            st.markdown(card["card_html"], unsafe_allow_html=True)
+            if card["store_link_html"]:
+                st.markdown(card["store_link_html"], unsafe_allow_html=True)
 
-            # Determine section title and button text
-            is_video = source.get("type") == "video"
-            section_title = "📹 Video Segment" if is_video else "📝 Product Details"
-            
-            store_link_html = ""
-            if source.get('link') and isinstance(source['link'], str) and len(source['link'].strip()) > 0:
-                store_link_html = f"""
-                    <div style="margin-top: 1rem;">
-                        <a href="{source['link']}" 
-                           target="_blank" 
-                           style="
-                               display: inline-block;
-                               background-color: #81E831;
-                               color: white;
-                               padding: 10px 20px;
-                               border-radius: 20px;
-                               text-decoration: none;
-                               font-weight: 500;
-                               margin-top: 10px;
-                               border: none;
-                               cursor: pointer;
-                           ">
-                            View on Store
-                        </a>
-                    </div>
-                """
-            # Product Card
-            card_html = f"""
-                <div style="background-color: white; padding: 1.5rem; border-radius: 10px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
-                    <h3 style="color: #333; margin-bottom: 1rem;">{section_title}</h3>
-                    <h4 style="color: #81E831;">{source.get('title', 'No Title')}</h4>
-                    <div style="margin: 1rem 0;">
-                        <div style="background: linear-gradient(90deg, #81E831 {source.get('similarity', 0)}%, #f1f1f1 {source.get('similarity', 0)}%); 
-                             height: 6px; border-radius: 3px; margin-bottom: 0.5rem;"></div>
-                        <p style="color: #666;">Similarity Score: {source.get('similarity', 0)}%</p>
-                    </div>
-                    <p style="color: #333; font-size: 1.1em;">{source.get('description', 'No description available')}</p>
-                    <p style="color: #666;">Product ID: {source.get('product_id', 'N/A')}</p>
-                    {f'<p style="color: #666;">Segment Time: {source.get("start_time", 0):.1f}s - {source.get("end_time", 0):.1f}s</p>' if is_video else ''}
-                </div>
-            """
-            
-            st.markdown(card_html, unsafe_allow_html=True)
-            if store_link_html:
-                st.markdown(store_link_html, unsafe_allow_html=True)
+            if card["similar"]:
+                st.markdown("**Similar items**")
+                for item in card["similar"]:
+                    st.markdown(f"- {item['title'] or item['product_id']} ({item['similarity']}%)")
                 
         
         with col2:
-            if source.get('video_url'):
-                if source.get('type') == 'video':
-                    st.markdown(
-                        create_video_embed(
-                            source['video_url'],
-                            source.get('start_time', 0),
-                            source.get('end_time', 0)
-                        ),
-                        unsafe_allow_html=True
-                    )
-                else:
-                    # For non-segmented videos, use st.video with autoplay disabled
-                    st.video(source['video_url'], start_time=0)
+            if card["player_html"]:
+                st.markdown(card["player_html"], unsafe_allow_html=True)
+            elif is_browser_url(card["video_url"]):
+                # For non-segmented videos, use st.video with autoplay disabled; the browser streams
+                # the URL, whereas a local path would be read into memory by Streamlit
+                st.video(card["video_url"], start_time=0)
 
 
 def create_suggestion_button(text):
@@ -201,18 +264,14 @@ def create_suggestion_button(text):
         </button>
     """
     
+def set_query(query):
+    st.session_state.query = query
+
+
 def render_suggestions():
     st.markdown("### Try asking about:")
     
-    # Define your example queries
-    suggestions = [
-        "Show me black dresses for a party",
-        "I'm looking for men's black t-shirts",
-        "What are the latest bridal collection designs?",
-        "Find me a casual black dress",
-        "Show me t-shirts for men",
-        "Can you suggest bridal wear?"
-    ]
+    suggestions = SUGGESTED_QUERIES
 
     # Style for the container
     st.markdown("""
@@ -231,10 +290,9 @@ def render_suggestions():
     for idx, suggestion in enumerate(suggestions):
         col_idx = idx % 3
         with cols[col_idx]:
-            if st.button(suggestion, key=f"suggestion_{idx}", use_container_width=True):
-                # When button is clicked, set it as the query
-                st.session_state.query = suggestion
-                st.rerun()
+            # The callback sets the query before the rerun, so no second full rerun is needed
+            st.button(suggestion, key=f"suggestion_{idx}", use_container_width=True,
+                      on_click=set_query, args=(suggestion,))
 
 # Utitily function to render results in the chat interface
 def render_results_section(response_data):
@@ -254,18 +312,22 @@ def render_results_section(response_data):
                 </div>
             """, unsafe_allow_html=True)
             
-            text_sources = [s for s in metadata["sources"] if s.get("type") == "text"]
-            if text_sources:
+            cards = response_data.get("cards")
+            if cards is None:
+                cards = with_cards(response_data)["cards"]
+
+            text_cards = [card for card in cards if card["type"] == "text"]
+            if text_cards:
                 st.markdown("### 📝 Retrieved Products")
-                for source in text_sources:
-                    render_product_details(source)
+                for card in text_cards:
+                    render_product_details(card)
                     st.markdown('<hr style="margin: 2rem 0;">', unsafe_allow_html=True)
             
-            video_sources = [s for s in metadata["sources"] if s.get("type") == "video"]
-            if video_sources:
+            video_cards = [card for card in cards if card["type"] == "video"]
+            if video_cards:
                 st.markdown("### 📹 Matching Product Videos")
-                for source in video_sources:
-                    render_product_details(source)
+                for card in video_cards:
+                    render_product_details(card)
                     st.markdown('<hr style="margin: 2rem 0;">', unsafe_allow_html=True)
                     
 def chat_page():
@@ -291,7 +353,7 @@ def chat_page():
     """, unsafe_allow_html=True)
 
     # Show suggestions if no messages yet
-    if not st.session_state.messages:
+    if not st.session_state.messages and not st.session_state.query:
         render_suggestions()
 
     # Chat messages display
@@ -314,11 +376,14 @@ def chat_page():
             "role": "user",
             "content": query
         })
+        with st.chat_message("user", avatar="👤"):
+            st.markdown(query)
         
         with st.chat_message("assistant", avatar="👗"):
             with st.spinner("Finding perfect matches..."):
                 try:
-                    response_data = get_rag_response(query)
+                    log_query(query)
+                    response_data = with_cards(get_precomputed_response(query) or get_rag_response(query))
                     st.markdown(response_data["response"])
                     if response_data.get("metadata") and response_data["metadata"].get("sources"):
                         render_results_section(response_data)
@@ -333,8 +398,6 @@ def chat_page():
             "role": "assistant",
             "content": response_data
         })
-        
-        st.rerun()
 
     # Chat input
     if prompt := st.chat_input("Hey! Ask me anything about fashion - styles, outfits, trends..."):
@@ -347,7 +410,8 @@ def chat_page():
         with st.chat_message("assistant", avatar="👗"):
             with st.spinner("Finding perfect matches..."):
                 try:
-                    response_data = get_rag_response(prompt)
+                    log_query(prompt)
+                    response_data = with_cards(get_precomputed_response(prompt) or get_rag_response(prompt))
                     st.markdown(response_data["response"])
                     if response_data.get("metadata") and response_data["metadata"].get("sources"):
                         render_results_section(response_data)
@@ -379,7 +443,20 @@ def chat_page():
             </ul>
         </div>
         """, unsafe_allow_html=True)
-        
+
+        render_upstream_health()
+
+
+# Refreshing the health table reruns only this fragment, not the chat history
+@st.fragment
+def render_upstream_health():
+    metrics = get_metrics()
+    if metrics:
+        with st.expander("Upstream health", expanded=False):
+            st.dataframe(metrics, use_container_width=True, hide_index=True)
+            st.button("Refresh", key="refresh_health")
+
+
 def main():
     query_params = st.query_params
     page = query_params.get("page", "chat")[0] if query_params.get("page") else "chat"
@@ -0,0 +1,98 @@
+import os
+import sys
+import uuid
+import argparse
+from batch_search import RateLimiter
+from reindex import list_products
+from schema import make_row
+from clip_server import resolve_upload
+from utils import (
+    CLIP_LENGTHS, shard_router, twelvelabs_client, get_query_model, find_products_without_coarse
+)
+
+# Products given coarse clips per minute; keeps the backfill from starving live embed traffic
+BACKFILL_RATE_PER_MINUTE = float(os.getenv('BACKFILL_RATE_PER_MINUTE', '6'))
+
+
+# Coarse clip rows for one product, with the attributes copied from its text row
+def coarse_rows(product, model_name, clip_length):
+    local_path = resolve_upload(product["video_url"])
+    if local_path:
+        with open(local_path, "rb") as video_file:
+            task = twelvelabs_client.embed.task.create(
+                model_name=model_name,
+                video_file=video_file,
+                video_clip_length=clip_length
+            )
+    else:
+        task = twelvelabs_client.embed.task.create(
+            model_name=model_name,
+            video_url=product["video_url"],
+            video_clip_length=clip_length
+        )
+    task.wait_for_done(sleep_interval=2)
+    task = task.retrieve()
+    if not task.video_embedding or not task.video_embedding.segments:
+        raise RuntimeError("no coarse video embeddings returned")
+    attributes = {
+        "product_id": product["product_id"],
+        "title": product["title"],
+        "description": product["desc"],
+        "video_url": product["video_url"],
+        "link": product["link"],
+        "category": product["category"],
+        "region": product["region"],
+        "embedding_type": "video_coarse",
+        "scope": "clip",
+        "resolution": "coarse"
+    }
+    return [
+        make_row(int(uuid.uuid4().int & (1<<63)-1), segment.embeddings_float,
+                 {**attributes, "start_time": segment.start_offset_sec, "end_time": segment.end_offset_sec})
+        for segment in task.video_embedding.segments
+    ]
+
+
+# Give every product indexed before coarse clips existed its coarse rows, on the shard holding the rest
+def backfill(clip_length=CLIP_LENGTHS["coarse"], rate_per_minute=BACKFILL_RATE_PER_MINUTE, dry_run=False):
+    missing = find_products_without_coarse()
+    print(f"{len(missing)} products have no coarse clips")
+    if dry_run or not missing:
+        return {}
+
+    model_name = get_query_model()
+    limiter = RateLimiter(rate_per_minute / 60)
+    failed = {}
+    done = 0
+    for shard in shard_router.shards:
+        for product in list_products(shard.collection):
+            if product["product_id"] not in missing:
+                continue
+            limiter.wait()
+            done += 1
+            print(f"[{done}/{len(missing)}] Coarse clips for {product['product_id']} {product['title']}")
+            try:
+                rows = coarse_rows(product, model_name, clip_length)
+                shard.collection.insert(rows)
+            except Exception as e:
+                failed[product["product_id"]] = str(e)
+    for shard in shard_router.shards:
+        shard.collection.flush()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create coarse clip rows for products indexed without them")
+    parser.add_argument("--coarse-clip", type=int, default=CLIP_LENGTHS["coarse"])
+    parser.add_argument("--rate", type=float, default=BACKFILL_RATE_PER_MINUTE, help="Products per minute")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the products missing coarse clips")
+    args = parser.parse_args()
+
+    failed = backfill(args.coarse_clip, args.rate, args.dry_run)
+    for product_id, error in failed.items():
+        print(f"  {product_id}: {error}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import os
+import io
+import sys
+import time
+import zipfile
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from image_preprocessing import preprocess_image
+from resilience import CircuitOpenError, Overloaded, RequestRejected, RETRY_BASE_DELAY, is_retryable
+from utils import embed_image, search_vectors
+
+# Parallel embed calls in flight and the request rate the TwelveLabs plan allows
+BATCH_EMBED_CONCURRENCY = int(os.getenv('BATCH_EMBED_CONCURRENCY', '4'))
+BATCH_EMBED_RATE = float(os.getenv('BATCH_EMBED_RATE', '0'))
+# Retries per image; each one waits its turn on the rate limiter like a first attempt
+BATCH_EMBED_RETRIES = int(os.getenv('BATCH_EMBED_RETRIES', '2'))
+# Kept apart from the interactive twelvelabs_embed slots, retry budget and breaker
+BATCH_EMBED_DEPENDENCY = "twelvelabs_embed_batch"
+# Query vectors sent in one multi-vector collection.search call
+BATCH_SEARCH_CHUNK = int(os.getenv('BATCH_SEARCH_CHUNK', '64'))
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+RESULT_COLUMNS = [
+    'Image', 'Rank', 'Title', 'Description', 'Link', 'Video URL',
+    'Start Time', 'End Time', 'Similarity', 'Raw Score', 'Error'
+]
+
+
+# Spaces out calls so the batch stays just under the API rate limit
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+# Expand uploaded files and zip archives into (name, bytes) image pairs
+def load_batch_images(files):
+    images = []
+    for name, data in files:
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for member in archive.infolist():
+                    if member.is_dir() or not member.filename.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    if os.path.basename(member.filename).startswith('.'):
+                        continue
+                    images.append((member.filename, archive.read(member)))
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            images.append((name, data))
+    return images
+
+
+# Collect image files and archives from local paths for the headless runner
+def load_paths(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for file_name in sorted(names):
+                    if file_name.lower().endswith(IMAGE_EXTENSIONS + ('.zip',)):
+                        full_path = os.path.join(root, file_name)
+                        with open(full_path, 'rb') as f:
+                            files.append((os.path.relpath(full_path, path), f.read()))
+        else:
+            with open(path, 'rb') as f:
+                files.append((os.path.basename(path), f.read()))
+    return load_batch_images(files)
+
+
+# Preprocess and embed images with bounded concurrency, keeping input order
+def embed_images(images, max_workers=BATCH_EMBED_CONCURRENCY, rate=BATCH_EMBED_RATE, progress_callback=None):
+    limiter = RateLimiter(rate)
+    vectors = [None] * len(images)
+    errors = [None] * len(images)
+
+    def embed_one(data):
+        processed = preprocess_image(data)
+        for attempt in range(BATCH_EMBED_RETRIES + 1):
+            limiter.wait()
+            try:
+                return embed_image(io.BytesIO(processed['image_bytes']), dependency=BATCH_EMBED_DEPENDENCY)
+            except (CircuitOpenError, Overloaded, RequestRejected):
+                raise
+            except Exception as e:
+                if attempt == BATCH_EMBED_RETRIES or not is_retryable(e.__cause__ or e):
+                    raise
+                time.sleep(RETRY_BASE_DELAY * 2 ** attempt)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(embed_one, data): idx for idx, (_, data) in enumerate(images)}
+        for done, future in enumerate(as_completed(futures), 1):
+            idx = futures[future]
+            try:
+                vectors[idx] = future.result()
+            except Exception as e:
+                errors[idx] = str(e)
+            if progress_callback:
+                progress_callback(done, len(images))
+
+    return vectors, errors
+
+
+# Embed every image and search all vectors in multi-vector chunks
+def run_batch_search(images, top_k=5, chunk_size=BATCH_SEARCH_CHUNK, progress_callback=None):
+    vectors, errors = embed_images(images, progress_callback=progress_callback)
+
+    rows = []
+    embedded = [idx for idx, vector in enumerate(vectors) if vector is not None]
+    matches = {}
+    for start in range(0, len(embedded), chunk_size):
+        chunk = embedded[start:start + chunk_size]
+        try:
+            chunk_results = search_vectors([vectors[idx] for idx in chunk], top_k=top_k)
+            for idx, results in zip(chunk, chunk_results):
+                matches[idx] = results
+        except Exception as e:
+            for idx in chunk:
+                errors[idx] = str(e)
+
+    for idx, (name, _) in enumerate(images):
+        if errors[idx]:
+            rows.append({'Image': name, 'Error': errors[idx]})
+            continue
+        for rank, hit in enumerate(matches.get(idx, []), 1):
+            rows.append({
+                'Image': name,
+                'Rank': rank,
+                'Title': hit.title,
+                'Description': hit.description,
+                'Link': hit.link,
+                'Video URL': hit.video_url,
+                'Start Time': hit.start_time,
+                'End Time': hit.end_time,
+                'Similarity': round(hit.similarity, 2),
+                'Raw Score': hit.score,
+                'Error': None
+            })
+
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+# Serialize batch results as CSV or Parquet bytes
+def results_to_bytes(df, file_format='csv'):
+    buffer = io.BytesIO()
+    if file_format == 'parquet':
+        df.to_parquet(buffer, index=False)
+    else:
+        df.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match many images against the product video catalog")
+    parser.add_argument("paths", nargs="+", help="Image files, directories or zip archives")
+    parser.add_argument("--top-k", type=int, default=5, help="Matches to keep per image")
+    parser.add_argument("--output", default="batch_results.csv", help="Output .csv or .parquet file")
+    args = parser.parse_args()
+
+    images = load_paths(args.paths)
+    if not images:
+        print("No images found")
+        return 1
+
+    def report(done, total):
+        print(f"Embedded {done}/{total} images", end="\r", flush=True)
+
+    started = time.monotonic()
+    df = run_batch_search(images, top_k=args.top_k, progress_callback=report)
+    elapsed = time.monotonic() - started
+
+    file_format = 'parquet' if args.output.endswith('.parquet') else 'csv'
+    with open(args.output, 'wb') as f:
+        f.write(results_to_bytes(df, file_format))
+
+    failed = df['Error'].notna().sum()
+    print(f"\nSearched {len(images)} images in {elapsed:.1f}s ({len(images) / max(elapsed, 1e-6):.1f} images/s), "
+          f"{failed} failed. Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
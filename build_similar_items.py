@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from similar_items import SimilarItems, SIMILAR_ITEMS_PATH, SIMILAR_ITEMS_K, SIMILAR_BLOCK_SIZE
+from utils import shard_router
+
+EXPORT_BATCH_SIZE = int(os.getenv('SIMILAR_ITEMS_EXPORT_BATCH', '1000'))
+
+
+# Product-level text vectors from every shard, one row per product
+def load_product_vectors(batch_size=EXPORT_BATCH_SIZE):
+    product_ids, titles, vectors = [], [], []
+    seen = set()
+    for shard in shard_router.shards:
+        iterator = shard.collection.query_iterator(
+            batch_size=batch_size,
+            expr='embedding_type == "text"',
+            output_fields=["product_id", "title", "vector"]
+        )
+        while True:
+            batch = iterator.next()
+            if not batch:
+                iterator.close()
+                break
+            for row in batch:
+                if row["product_id"] in seen:
+                    continue
+                seen.add(row["product_id"])
+                product_ids.append(row["product_id"])
+                titles.append(row["title"])
+                vectors.append(row["vector"])
+            print(f"Read {len(product_ids)} products", end="\r", flush=True)
+    return product_ids, titles, np.asarray(vectors, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the similar-items kNN graph over all products")
+    parser.add_argument("--output", default=SIMILAR_ITEMS_PATH)
+    parser.add_argument("--k", type=int, default=SIMILAR_ITEMS_K, help="Neighbours kept per product")
+    parser.add_argument("--block-size", type=int, default=SIMILAR_BLOCK_SIZE)
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    product_ids, titles, vectors = load_product_vectors()
+    items = SimilarItems.build(product_ids, titles, vectors, k=args.k, block_size=args.block_size)
+    items.save(args.output)
+    print(f"\nBuilt {args.k}-NN graph over {len(items)} products in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
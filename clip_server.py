@@ -0,0 +1,277 @@
+import os
+import re
+import hmac
+import hashlib
+import shutil
+import secrets
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+
+logger = logging.getLogger(__name__)
+
+# Loopback by default; set 0.0.0.0 only behind a proxy that fronts the app
+CLIP_SERVER_HOST = os.getenv('CLIP_SERVER_HOST', '127.0.0.1')
+CLIP_SERVER_PORT = int(os.getenv('CLIP_SERVER_PORT', '8502'))
+# Address the browser uses to reach the clip server, e.g. http://localhost:8502 for a local run.
+# Left unset, no default can be right for remote viewers, so players link the full video instead.
+CLIP_BASE_URL = os.getenv('CLIP_BASE_URL', '').rstrip('/')
+CLIP_CACHE_DIR = os.getenv('CLIP_CACHE_DIR', '.clip_cache')
+CLIP_CACHE_MAX_BYTES = int(os.getenv('CLIP_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+# Local source videos must live under this directory
+CLIP_LOCAL_ROOT = os.path.abspath(os.getenv('CLIP_LOCAL_ROOT', 'uploads'))
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+# Serve matched segments as small cached clips instead of seeking into the full MP4; needs a
+# reachable CLIP_BASE_URL and ffmpeg, otherwise every clip request would fail
+CLIP_SERVICE_ENABLED = (
+    os.getenv('CLIP_SERVICE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    and bool(CLIP_BASE_URL)
+    and shutil.which(FFMPEG_BINARY) is not None
+)
+# Longest clip the embed API produces; longer requests are cut to this
+CLIP_MAX_SECONDS = float(os.getenv('CLIP_MAX_SECONDS', '10'))
+# Signs clip URLs so the server only cuts segments the app linked to; processes sharing one
+# clip server must share the key
+CLIP_SIGNING_KEY = (os.getenv('CLIP_SIGNING_KEY') or secrets.token_hex(32)).encode()
+CHUNK_SIZE = 64 * 1024
+
+# Striped per-clip locks, so concurrent requests for one clip cut it once and the set stays bounded
+_key_locks = [threading.Lock() for _ in range(int(os.getenv('CLIP_LOCK_STRIPES', '64')))]
+_server = None
+_server_error = None
+_server_lock = threading.Lock()
+_prefetch_executor = ThreadPoolExecutor(max_workers=int(os.getenv('CLIP_PREFETCH_WORKERS', '2')),
+                                        thread_name_prefix="clip")
+
+
+def clip_key(video_url, start_time, end_time):
+    return hashlib.sha1(f"{video_url}|{float(start_time):.3f}|{float(end_time):.3f}".encode()).hexdigest()
+
+
+def clip_path(key):
+    return os.path.join(CLIP_CACHE_DIR, f"{key}.mp4")
+
+
+# Uploaded videos are stored and shown as an opaque key under this scheme, never as a server path
+UPLOAD_SCHEME = "upload://"
+
+
+def upload_url(path):
+    return UPLOAD_SCHEME + os.path.basename(path)
+
+
+def is_upload_url(video_url):
+    return str(video_url or "").startswith(UPLOAD_SCHEME)
+
+
+# Server path behind an upload key, or None when the key does not name a file under CLIP_LOCAL_ROOT
+def resolve_upload(video_url):
+    if not is_upload_url(video_url):
+        return None
+    name = video_url[len(UPLOAD_SCHEME):]
+    if not name or name != os.path.basename(name) or name.startswith("."):
+        return None
+    path = os.path.join(CLIP_LOCAL_ROOT, name)
+    return path if os.path.isfile(path) else None
+
+
+# Sources the browser can load itself
+def is_browser_url(video_url):
+    return urlparse(str(video_url or "")).scheme in ("http", "https")
+
+
+# Only remote http(s) sources or known uploads are handed to ffmpeg
+def is_allowed_source(video_url):
+    return is_browser_url(video_url) or resolve_upload(video_url) is not None
+
+
+def _lock_for(key):
+    return _key_locks[int(key[:8], 16) % len(_key_locks)]
+
+
+# Evict least recently used clips until the cache fits its byte budget
+def enforce_cache_limit():
+    clips = []
+    for name in os.listdir(CLIP_CACHE_DIR):
+        if name.endswith(".mp4"):
+            path = os.path.join(CLIP_CACHE_DIR, name)
+            stat = os.stat(path)
+            clips.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in clips)
+    for _, size, path in sorted(clips):
+        if total <= CLIP_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+# Cut one segment with ffmpeg into the cache, or return the cached clip
+def prepare_clip(video_url, start_time, end_time):
+    if not is_allowed_source(video_url):
+        raise ValueError(f"Clip source not allowed: {video_url}")
+    key = clip_key(video_url, start_time, end_time)
+    path = clip_path(key)
+    with _lock_for(key):
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        os.makedirs(CLIP_CACHE_DIR, exist_ok=True)
+        duration = min(max(float(end_time) - float(start_time), 0.5), CLIP_MAX_SECONDS)
+        tmp_path = path + ".part.mp4"
+        # Seeking before -i reads only the needed byte ranges from HTTP sources
+        subprocess.run([
+            FFMPEG_BINARY, "-y", "-loglevel", "error",
+            "-ss", f"{float(start_time):.3f}", "-i", resolve_upload(video_url) or video_url, "-t", f"{duration:.3f}",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+            "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart",
+            tmp_path
+        ], check=True, timeout=120)
+        os.replace(tmp_path, path)
+    enforce_cache_limit()
+    return path
+
+
+# Cut segments in the background at ingest so the first view is already cached
+def prefetch_clips(video_url, segments):
+    if not CLIP_SERVICE_ENABLED:
+        return
+    for start_time, end_time in segments:
+        future = _prefetch_executor.submit(prepare_clip, video_url, start_time, end_time)
+        future.add_done_callback(_log_prefetch_error)
+
+
+def _log_prefetch_error(future):
+    if future.exception() is not None:
+        logger.warning("Clip prefetch failed: %s", future.exception())
+
+
+def clip_signature(video_url, start, end):
+    message = f"{video_url}|{start}|{end}".encode()
+    return hmac.new(CLIP_SIGNING_KEY, message, hashlib.sha256).hexdigest()
+
+
+# URL the browser loads for one matched segment
+def clip_url(video_url, start_time, end_time):
+    start, end = f"{float(start_time):.3f}", f"{float(end_time):.3f}"
+    query = urlencode({"src": video_url, "start": start, "end": end,
+                       "sig": clip_signature(video_url, start, end)})
+    return f"{CLIP_BASE_URL}/clip?{query}"
+
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+# Byte range requested by the browser, clamped to the file size; None means the whole file
+def parse_range(header, size):
+    match = RANGE_PATTERN.match(header or "")
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if first == "":
+        if last == "":
+            return None
+        length = min(int(last), size)
+        return size - length, size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+class ClipRequestHandler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.handle_clip(send_body=False)
+
+    def do_GET(self):
+        self.handle_clip(send_body=True)
+
+    def handle_clip(self, send_body):
+        parsed = urlparse(self.path)
+        if parsed.path != "/clip":
+            self.send_error(404)
+            return
+        params = parse_qs(parsed.query)
+        try:
+            src, start, end = params["src"][0], params["start"][0], params["end"][0]
+            expected = clip_signature(src, start, end)
+        except KeyError:
+            self.send_error(400, "Missing clip parameters")
+            return
+        if not hmac.compare_digest(expected, params.get("sig", [""])[0]):
+            self.send_error(403, "Invalid clip signature")
+            return
+        try:
+            path = prepare_clip(src, float(start), float(end))
+        except (KeyError, ValueError) as e:
+            self.send_error(400, str(e))
+            return
+        except Exception as e:
+            logger.warning("Clip preparation failed: %s", e)
+            self.send_error(502, "Could not prepare clip")
+            return
+
+        size = os.path.getsize(path)
+        try:
+            byte_range = parse_range(self.headers.get("Range"), size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.end_headers()
+            return
+
+        start, end = byte_range or (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Cache-Control", "public, max-age=86400")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not send_body:
+            return
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        logger.debug("clip server: " + format, *args)
+
+
+# Start the range-serving clip server once per process. If the port is taken, players fall
+# back to the full video rather than the app failing to start.
+def start_clip_server():
+    global _server, _server_error
+    if not CLIP_SERVICE_ENABLED:
+        return None
+    with _server_lock:
+        if _server is None and _server_error is None:
+            try:
+                _server = ThreadingHTTPServer((CLIP_SERVER_HOST, CLIP_SERVER_PORT), ClipRequestHandler)
+            except OSError as e:
+                _server_error = e
+                logger.warning("Clip server could not bind %s:%d (%s); playing full videos instead",
+                               CLIP_SERVER_HOST, CLIP_SERVER_PORT, e)
+                return None
+            threading.Thread(target=_server.serve_forever, name="clip-server", daemon=True).start()
+    return _server
+
+
+# Whether players should link to cut clips rather than the full source video
+def clip_service_available():
+    return CLIP_SERVICE_ENABLED and _server_error is None
@@ -0,0 +1,75 @@
+import os
+import io
+import hashlib
+from PIL import Image, ImageOps
+
+# Longest side sent to the embedding model; larger uploads are downsized to this
+IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', '512'))
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))
+EXIF_ORIENTATION = 0x0112
+
+
+# Stable key for an uploaded image, used to cache the preprocessed result
+def image_digest(raw_bytes):
+    return hashlib.sha1(raw_bytes).hexdigest()
+
+
+# Read the raw bytes from an uploaded file, BytesIO or path
+def read_image_bytes(image_file):
+    if isinstance(image_file, (bytes, bytearray)):
+        return bytes(image_file)
+    if isinstance(image_file, str):
+        with open(image_file, "rb") as f:
+            return f.read()
+    if hasattr(image_file, "getvalue"):
+        return image_file.getvalue()
+    image_file.seek(0)
+    return image_file.read()
+
+
+# Decode once, apply EXIF orientation, downsize and re-encode as a compact JPEG
+def preprocess_image(raw_bytes, max_side=IMAGE_MAX_SIDE, quality=IMAGE_JPEG_QUALITY):
+    image = Image.open(io.BytesIO(raw_bytes))
+    original_size = image.size
+
+    # exif_transpose returns a copy even for upright images, so read the orientation tag itself
+    rotated = image.getexif().get(EXIF_ORIENTATION, 1) != 1
+    image = ImageOps.exif_transpose(image)
+
+    resized = max(image.size) > max_side
+    if resized:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    processed_bytes = buffer.getvalue()
+
+    # Nothing to fix and re-encoding would not shrink the file, so keep the original in its own format
+    if not rotated and not resized and len(processed_bytes) >= len(raw_bytes):
+        processed_bytes = raw_bytes
+
+    return {
+        "image_bytes": processed_bytes,
+        "original_size": original_size,
+        "size": image.size,
+        "original_bytes": len(raw_bytes),
+        "processed_bytes": len(processed_bytes),
+        "bytes_saved": max(0, len(raw_bytes) - len(processed_bytes))
+    }
+
+
+# Human readable byte count for the savings caption
+def format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
@@ -0,0 +1,71 @@
+import sys
+import json
+import time
+import argparse
+from twelvelabs import TwelveLabs
+from video_upload import UploadProgress, create_upload_tasks, stage_local_video, UPLOAD_CONCURRENCY
+from clip_server import upload_url
+from utils import TWELVELABS_API_KEY, CLIP_LENGTHS, get_query_model, generate_embedding, insert_embeddings
+
+
+# Products in the src/sample-data.json format; "video_path" entries are uploaded from disk
+def load_products(path):
+    with open(path) as f:
+        products = json.load(f)
+    return products if isinstance(products, list) else [products]
+
+
+def print_progress(progress):
+    print(f"{progress.summary()} ({progress.fraction():.0%})", end="\r", flush=True)
+
+
+# Upload every local video in parallel, then wait for, embed and insert each product in turn
+def ingest_products(products, max_workers=UPLOAD_CONCURRENCY):
+    model_name = get_query_model()
+    client = TwelveLabs(api_key=TWELVELABS_API_KEY)
+    for product in products:
+        if product.get("video_path"):
+            product["video_path"] = stage_local_video(product["video_path"])
+            product["video_url"] = upload_url(product["video_path"])
+
+    local_paths = [product["video_path"] for product in products if product.get("video_path")]
+    tasks, upload_errors = {}, {}
+    if local_paths:
+        tasks, upload_errors = create_upload_tasks(client, model_name, local_paths, CLIP_LENGTHS, UploadProgress(),
+                                                   max_workers=max_workers, on_progress=print_progress)
+        print()
+
+    failed = {}
+    for index, product in enumerate(products, 1):
+        # A failed upload skips only its own product
+        if product.get("video_path") in upload_errors:
+            failed[product["product_id"]] = upload_errors[product["video_path"]]
+            continue
+        print(f"[{index}/{len(products)}] Embedding {product['product_id']} {product['title']}")
+        embeddings, error = generate_embedding(product, model_name=model_name,
+                                               video_tasks=tasks.get(product.get("video_path")))
+        if not error and not insert_embeddings(embeddings, product):
+            error = "insert failed"
+        if error:
+            failed[product["product_id"]] = error
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed and insert products, streaming local videos to the API")
+    parser.add_argument("products", help="JSON list of products with video_url or video_path")
+    parser.add_argument("--concurrency", type=int, default=UPLOAD_CONCURRENCY, help="Uploads in flight")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    products = load_products(args.products)
+    failed = ingest_products(products, args.concurrency)
+    print(f"Ingested {len(products) - len(failed)} products in {time.monotonic() - started:.1f}s, "
+          f"{len(failed)} failed")
+    for product_id, error in failed.items():
+        print(f"  {product_id}: {error}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
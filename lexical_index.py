@@ -0,0 +1,161 @@
+import os
+import re
+import math
+import threading
+from collections import Counter, defaultdict
+
+# BM25 parameters for the in-process keyword index over product titles and descriptions
+BM25_K1 = float(os.getenv('BM25_K1', '1.2'))
+BM25_B = float(os.getenv('BM25_B', '0.75'))
+# Title terms count this many times, so a title match outranks a passing mention in a description
+TITLE_WEIGHT = int(os.getenv('LEXICAL_TITLE_WEIGHT', '2'))
+# Queries of at most this many terms whose terms are all rare are answered from the index alone
+KEYWORD_MAX_TERMS = int(os.getenv('LEXICAL_KEYWORD_MAX_TERMS', '2'))
+RARE_TERM_FRACTION = float(os.getenv('LEXICAL_RARE_TERM_FRACTION', '0.05'))
+# Reciprocal rank fusion constant; larger values flatten the head of each ranking
+RRF_K = int(os.getenv('LEXICAL_RRF_K', '60'))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+DOC_FIELDS = ("product_id", "title", "description", "link", "video_url", "category")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+# Product ids are matched whole, so "FASH-001" is not split into "fash" and "001"
+def normalize_id(value):
+    return str(value).strip().lower()
+
+
+# The whole query and each whitespace-separated word, trimmed of punctuation, as possible ids
+def id_candidates(query):
+    words = (query or "").split()
+    return {normalize_id(query)} | {normalize_id(word.strip(".,;:!?\"'()[]")) for word in words}
+
+
+# Inverted index with BM25 scoring, one document per product
+class LexicalIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.docs = {}
+        self.id_terms = {}
+        self.lengths = {}
+        self.postings = defaultdict(dict)
+        self.total_length = 0
+
+    def _index(self, doc):
+        product_id = doc["product_id"]
+        if product_id in self.docs:
+            self._remove(product_id)
+        terms = Counter(tokenize(doc.get("title")) * TITLE_WEIGHT + tokenize(doc.get("description")))
+        # The product id itself is a term so exact id lookups hit
+        terms[normalize_id(product_id)] += 1
+        for term, count in terms.items():
+            self.postings[term][product_id] = count
+        self.docs[product_id] = {field: doc.get(field) or "" for field in DOC_FIELDS}
+        self.id_terms[normalize_id(product_id)] = product_id
+        self.lengths[product_id] = sum(terms.values())
+        self.total_length += self.lengths[product_id]
+
+    def _remove(self, product_id):
+        for term in list(self.postings):
+            postings = self.postings[term]
+            if postings.pop(product_id, None) is not None and not postings:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(product_id, 0)
+        self.docs.pop(product_id, None)
+        self.id_terms.pop(normalize_id(product_id), None)
+
+    def add(self, doc):
+        with self.lock:
+            self._index(doc)
+
+    # Replace the whole index, e.g. after a rebuild from the collection
+    def load(self, docs):
+        fresh = LexicalIndex()
+        for doc in docs:
+            fresh._index(doc)
+        with self.lock:
+            self.docs, self.id_terms, self.lengths = fresh.docs, fresh.id_terms, fresh.lengths
+            self.postings, self.total_length = fresh.postings, fresh.total_length
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+
+    # Product ids and BM25 scores, best first, restricted to docs matching the filters
+    def search(self, query, top_k=5, filters=None):
+        filters = {field: value for field, value in (filters or {}).items() if value}
+        with self.lock:
+            terms = set(tokenize(query)) | (id_candidates(query) & self.id_terms.keys())
+            if not self.docs or not terms:
+                return []
+            average_length = self.total_length / len(self.docs)
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = self._idf(term)
+                for product_id, count in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[product_id] / average_length)
+                    scores[product_id] += idf * count * (BM25_K1 + 1) / (count + norm)
+            ranked = sorted(
+                (item for item in scores.items()
+                 if all(self.docs[item[0]].get(field) == value for field, value in filters.items())),
+                key=lambda item: item[1], reverse=True
+            )
+            return ranked[:top_k]
+
+    # Product ids and short queries made only of rare terms gain nothing from an embedding
+    def is_keyword_query(self, query):
+        terms = tokenize(query)
+        with self.lock:
+            if not terms or not self.docs:
+                return False
+            if id_candidates(query) & self.id_terms.keys() or any(term in self.id_terms for term in terms):
+                return True
+            if len(set(terms)) > KEYWORD_MAX_TERMS:
+                return False
+            rare_limit = max(1, int(len(self.docs) * RARE_TERM_FRACTION))
+            return all(0 < len(self.postings.get(term, ())) <= rare_limit for term in terms)
+
+    # Text sources in the shape the chat cards render, with scores scaled to the best hit
+    def to_sources(self, ranked):
+        if not ranked:
+            return []
+        best = ranked[0][1] or 1.0
+        with self.lock:
+            return [
+                {
+                    "title": self.docs[product_id]["title"] or 'Untitled',
+                    "description": self.docs[product_id]["description"] or 'No description available',
+                    "product_id": product_id,
+                    "video_url": self.docs[product_id]["video_url"],
+                    "link": self.docs[product_id]["link"],
+                    "similarity": round(100 * score / best, 2),
+                    "raw_score": score,
+                    "type": "text"
+                }
+                for product_id, score in ranked if product_id in self.docs
+            ]
+
+
+# Fuse several rankings of source dicts by product id, keeping the first source seen for each
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    scores = defaultdict(float)
+    sources = {}
+    for ranking in rankings:
+        for rank, source in enumerate(ranking):
+            key = source.get("product_id") or source.get("title")
+            scores[key] += 1.0 / (k + rank + 1)
+            sources.setdefault(key, source)
+    ranked = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [sources[key] for key in ranked[:top_k]]
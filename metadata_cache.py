@@ -0,0 +1,44 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Rows are immutable once inserted, so cached card data never goes stale
+METADATA_CACHE_SIZE = int(os.getenv('METADATA_CACHE_SIZE', '50000'))
+# Ids per bulk query; keeps the "id in [...]" expression well under Milvus limits
+METADATA_FETCH_BATCH = 500
+
+
+# Bounded LRU of card fields keyed by row id, filled in bulk from the collection
+class MetadataCache:
+    def __init__(self, fetch, max_size=METADATA_CACHE_SIZE):
+        self.fetch = fetch
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, row_id, attributes):
+        with self.lock:
+            self.entries[row_id] = attributes
+            self.entries.move_to_end(row_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    # Card fields for many ids, with one bulk query for whatever is not cached
+    def get_many(self, row_ids):
+        found = {}
+        missing = []
+        with self.lock:
+            for row_id in row_ids:
+                if row_id in self.entries:
+                    self.entries.move_to_end(row_id)
+                    found[row_id] = self.entries[row_id]
+                elif row_id not in found:
+                    missing.append(row_id)
+
+        missing = list(dict.fromkeys(missing))
+        for start in range(0, len(missing), METADATA_FETCH_BATCH):
+            for row in self.fetch(missing[start:start + METADATA_FETCH_BATCH]):
+                row_id = row.pop("id")
+                found[row_id] = row
+                self.put(row_id, row)
+        return found
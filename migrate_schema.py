@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import argparse
+from dotenv import load_dotenv
+from pymilvus import Collection, connections
+from schema import create_collection, build_indexes, legacy_row_to_typed, model_from_description
+
+# From the environment rather than utils, which would open OpenAI and TwelveLabs clients
+load_dotenv()
+COLLECTION_NAME = os.getenv('COLLECTION_NAME')
+
+MIGRATE_BATCH_SIZE = int(os.getenv('MIGRATE_BATCH_SIZE', '1000'))
+
+
+# Copy a collection with a metadata JSON blob into a new collection with typed scalar fields
+def migrate_collection(source_name, target_name, batch_size=MIGRATE_BATCH_SIZE):
+    source = Collection(source_name)
+    source.load()
+    dim = next(field.params["dim"] for field in source.schema.fields if field.name == "vector")
+    target = create_collection(target_name, dim=dim, model_name=model_from_description(source.description))
+
+    iterator = source.query_iterator(
+        batch_size=batch_size,
+        expr="id >= 0",
+        output_fields=["id", "vector", "metadata", "embedding_type"]
+    )
+    count = 0
+    while True:
+        batch = iterator.next()
+        if not batch:
+            iterator.close()
+            break
+        target.insert([legacy_row_to_typed(row) for row in batch])
+        count += len(batch)
+        print(f"Migrated {count} rows", end="\r", flush=True)
+
+    build_indexes(target)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate a collection to the typed scalar schema")
+    parser.add_argument("--source", default=COLLECTION_NAME, help="Collection using the metadata JSON field")
+    parser.add_argument("--target", required=True, help="Name of the typed collection to create")
+    parser.add_argument("--batch-size", type=int, default=MIGRATE_BATCH_SIZE)
+    args = parser.parse_args()
+    connections.connect(uri=os.getenv('URL'), token=os.getenv('TOKEN'))
+
+    started = time.monotonic()
+    count = migrate_collection(args.source, args.target, args.batch_size)
+    print(f"\nMigrated {count} rows from {args.source} to {args.target} in {time.monotonic() - started:.1f}s")
+    print(f"Point COLLECTION_NAME (or SHARD_COLLECTIONS) at {args.target} to serve from it")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
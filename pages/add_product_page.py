@@ -1,5 +1,8 @@
 import streamlit as st
 from utils import generate_embedding, insert_embeddings
+from video_upload import VIDEO_EXTENSIONS, save_uploaded_video
+from clip_server import upload_url
+from services import start_services
 
 # Set this to False for demonstration mode (Disabling the insertion into the Database)
 ENABLE_INSERTIONS = False  # Change to True to enable insertions
@@ -27,7 +30,15 @@ def add_product_data():
     
     with col2:
         link = st.text_input("Link", disabled=not ENABLE_INSERTIONS)
-        video_url = st.text_input("Video URL", disabled=not ENABLE_INSERTIONS)
+        video_source = st.radio("Video source", ["Video URL", "Upload file"],
+                                horizontal=True, disabled=not ENABLE_INSERTIONS)
+        video_url = uploaded_video = None
+        if video_source == "Video URL":
+            video_url = st.text_input("Video URL", disabled=not ENABLE_INSERTIONS)
+        else:
+            uploaded_video = st.file_uploader("Video file", type=[ext.lstrip('.') for ext in VIDEO_EXTENSIONS],
+                                              disabled=not ENABLE_INSERTIONS)
+        category = st.text_input("Category (optional)", disabled=not ENABLE_INSERTIONS)
     
     st.markdown(
         """
@@ -60,15 +71,27 @@ def add_product_data():
             st.info("Product insertion is disabled in demonstration mode.")
             return
             
-        if product_id and title and description and link and video_url:
+        if product_id and title and description and link and (video_url or uploaded_video):
             product_data = {
                 "product_id": product_id,
                 "title": title,
                 "desc": description,
                 "link": link,
-                "video_url": video_url
+                "video_url": video_url,
+                "category": category.strip().lower()
             }
-            
+
+            # Uploaded videos are kept under the clip root and streamed to the embed API from disk
+            if not video_url:
+                try:
+                    local_path = save_uploaded_video(uploaded_video)
+                except (OSError, ValueError) as e:
+                    st.error(f"Could not read video file: {str(e)}")
+                    return
+                # Pages and players only ever see the opaque key; the path stays on the server
+                product_data["video_url"] = upload_url(local_path)
+                product_data["video_path"] = local_path
+
             with st.spinner("Processing product..."):
                 embeddings, error = generate_embedding(product_data)
                 
@@ -88,6 +111,7 @@ def add_product_data():
 
 def main():
     st.set_page_config(page_title="Add Product Data", page_icon=":package:")
+    start_services()
     st.markdown(
         """
         <style>
@@ -1,22 +1,284 @@
 import streamlit as st
-from utils import search_similar_videos, create_video_embed
+from utils import embed_image, search_video_first_page, search_video_page, create_video_embed, VIDEO_PAGE_DEPTH
+from resilience import UpstreamError, RequestRejected
+from services import start_services
+from search_results import format_similarity, format_seconds
+from batch_search import load_batch_images, run_batch_search, results_to_bytes
 import os
 from PIL import Image
 import io
+from image_preprocessing import read_image_bytes, image_digest, preprocess_image, format_bytes
+
+# Preprocessed images kept in the process-wide cache, keyed by the digest of the raw upload
+MAX_CACHED_IMAGES = int(os.getenv('MAX_CACHED_IMAGES', '64'))
+DEFAULT_IMAGE_PATH = "src/tshirt-black.jpg"
+
+
+# The default image is read from disk once per process, not on every rerun
+@st.cache_data(show_spinner=False)
+def read_default_image(path=DEFAULT_IMAGE_PATH):
+    with open(path, "rb") as f:
+        return f.read()
 
 
 def load_default_image():
     try:
-        default_image_path = "src/tshirt-black.jpg"
-        if os.path.exists(default_image_path):
-            with open(default_image_path, "rb") as f:
-                return io.BytesIO(f.read())
+        if os.path.exists(DEFAULT_IMAGE_PATH):
+            return io.BytesIO(read_default_image())
     except Exception as e:
         st.error(f"Error loading default image: {str(e)}")
     return None
 
+
+# Decoded and resized once per distinct image; the leading underscore keeps the bytes out of the cache key
+@st.cache_data(max_entries=MAX_CACHED_IMAGES, show_spinner=False)
+def preprocess_cached(digest, _raw_bytes):
+    return preprocess_image(_raw_bytes)
+
+
+def get_preprocessed_image(image_file):
+    raw_bytes = read_image_bytes(image_file)
+    return preprocess_cached(image_digest(raw_bytes), raw_bytes)
+
+
+# Embed the image once and keep the query vector for every later page
+def start_search(processed_image, page_size, filters=None):
+    digest = image_digest(processed_image["image_bytes"])
+    search_state = st.session_state.get("visual_search")
+    try:
+        if search_state and search_state["digest"] == digest:
+            vector = search_state["vector"]
+        else:
+            vector = embed_image(io.BytesIO(processed_image["image_bytes"]))
+        first_page, window_expr = search_video_first_page(vector, page_size, VIDEO_PAGE_DEPTH, filters=filters)
+    except RequestRejected as e:
+        st.error(f"This image could not be searched: {str(e)}")
+        return
+    except UpstreamError as e:
+        st.warning(f"Visual search is degraded: {str(e)}")
+        return
+    st.session_state.visual_search = {
+        "digest": digest,
+        "vector": vector,
+        "filters": filters,
+        "window_expr": window_expr,
+        "pages": [first_page],
+        "cursor": page_size if len(first_page) >= page_size else None
+    }
+
+
+# Fetch the next page of the same ranking, reusing the stored query vector and coarse windows
+def load_more_results(page_size):
+    search_state = st.session_state.visual_search
+    try:
+        page, cursor = search_video_page(
+            search_state["vector"], page_size, search_state["cursor"], search_state["window_expr"],
+            filters=search_state["filters"]
+        )
+    except UpstreamError as e:
+        st.warning(f"Visual search is degraded: {str(e)}")
+        return
+    search_state["pages"].append(page)
+    search_state["cursor"] = cursor
+
+
+def render_result(idx, result):
+    with st.expander(f"Match #{idx} - Similarity: {format_similarity(result.similarity)}", expanded=(idx==1)):
+        video_col, details_col = st.columns([2, 1])
+        
+        with video_col:
+            st.markdown("#### Video Segment")
+            video_embed = create_video_embed(
+                result.video_url,
+                result.start_time,
+                result.end_time
+            )
+            st.markdown(video_embed, unsafe_allow_html=True)
+        
+        with details_col:
+            st.markdown(f"""
+                #### Details
+                
+                📝 **Title**  
+                {result.title}
+                
+                📖 **Description**  
+                {result.description}
+                
+                🔗 **Link**  
+                [Open Product]({result.link})
+                
+                🕒 **Time Range**  
+                {format_seconds(result.start_time)} - {format_seconds(result.end_time)}
+                
+                📊 **Similarity Score**  
+                {format_similarity(result.similarity)}
+            """)
+
+
+def render_result_pages(search_state):
+    if not any(len(page) for page in search_state["pages"]):
+        st.warning("No similar videos found")
+        return
+    st.subheader("Results")
+    idx = 0
+    for page in search_state["pages"]:
+        for result in page:
+            idx += 1
+            render_result(idx, result)
+    if search_state["cursor"] is None:
+        st.caption("No more results")
+
+
+def render_single_search():
+    st.markdown("""
+        <div style="padding: 1rem; background-color: #f0f2f6; border-radius: 0.5rem; margin-bottom: 1rem;">
+            ℹ️ Using default test image. You can upload your own image to search for similar products.
+        </div>
+    """, unsafe_allow_html=True)
+
+
+    with st.container():
+        col1, col2 = st.columns([1, 2])
+        
+        with col1:
+            uploaded_file = st.file_uploader(
+                "Upload Image",
+                type=['png', 'jpg', 'jpeg'],
+                help="Select an image to find similar video segments"
+            )
+
+            if not uploaded_file:
+                default_image = load_default_image()
+                if default_image:
+                    uploaded_file = default_image
+            processed_image = None
+            if uploaded_file:
+                try:
+                    processed_image = get_preprocessed_image(uploaded_file)
+                except Exception as e:
+                    st.error(f"Error reading image: {str(e)}")
+                    uploaded_file = None
+            if processed_image:
+                st.image(processed_image["image_bytes"], use_container_width=True)
+                st.caption(
+                    f"{processed_image['original_size'][0]}×{processed_image['original_size'][1]} → "
+                    f"{processed_image['size'][0]}×{processed_image['size'][1]}, "
+                    f"{format_bytes(processed_image['original_bytes'])} → "
+                    f"{format_bytes(processed_image['processed_bytes'])} "
+                    f"(saved {format_bytes(processed_image['bytes_saved'])})"
+                )
+        
+        with col2:
+            if uploaded_file:
+                render_search_panel(processed_image)
+
+
+# Search controls and results rerun on their own, so moving the slider skips the image and page CSS
+@st.fragment
+def render_search_panel(processed_image):
+    st.subheader("Search Parameters")
+    page_size = st.slider(
+        "Results per page",
+        min_value=1,
+        max_value=20,
+        value=2,
+        help="Select the number of similar videos to retrieve per page"
+    )
+    
+
+    slider_progress = (page_size - 1) / 19 * 100
+    st.markdown(
+        f'''
+        <style>
+        div.stSlider > div[data-baseweb="slider"] > div > div {{
+            background: linear-gradient(to right, #81E831 {slider_progress}%, rgba(151, 166, 195, 0.25) {slider_progress}%);
+        }}
+        </style>
+        ''',
+        unsafe_allow_html=True
+    )
+    
+    category = st.text_input("Category filter (optional)", help="Only match products in this category")
+    filters = {"category": category.strip().lower()} if category.strip() else None
+    
+    if st.button("Search", type="primary", use_container_width=True):
+        with st.spinner("Searching for similar videos..."):
+            start_search(processed_image, page_size, filters)
+
+    search_state = st.session_state.get("visual_search")
+    if search_state and search_state["digest"] == image_digest(processed_image["image_bytes"]):
+        render_result_pages(search_state)
+        if search_state["cursor"] is not None:
+            st.button(
+                "Load more",
+                use_container_width=True,
+                on_click=load_more_results,
+                args=(page_size,)
+            )
+
+
+# Batch widgets rerun only this section
+@st.fragment
+def render_batch_search():
+    st.markdown("""
+        <div style="padding: 1rem; background-color: #f0f2f6; border-radius: 0.5rem; margin-bottom: 1rem;">
+            ℹ️ Upload many images or a zip archive of a lookbook to match them all against the catalog.
+        </div>
+    """, unsafe_allow_html=True)
+
+    uploaded_files = st.file_uploader(
+        "Upload Images or Archive",
+        type=['png', 'jpg', 'jpeg', 'zip'],
+        accept_multiple_files=True,
+        help="Images and zip archives of images are searched together"
+    )
+    top_k = st.number_input("Matches per image", min_value=1, max_value=20, value=3)
+
+    if uploaded_files and st.button("Run Batch Search", type="primary", use_container_width=True):
+        images = load_batch_images([(f.name, f.getvalue()) for f in uploaded_files])
+        if not images:
+            st.warning("No images found in the upload")
+            return
+
+        progress = st.progress(0.0, text=f"Embedding {len(images)} images...")
+
+        def report(done, total):
+            progress.progress(done / total, text=f"Embedded {done}/{total} images")
+
+        with st.spinner("Searching for similar videos..."):
+            st.session_state.batch_results = run_batch_search(images, top_k=int(top_k), progress_callback=report)
+
+    df = st.session_state.get("batch_results")
+    if df is not None:
+        failed = int(df['Error'].notna().sum())
+        st.subheader("Results")
+        if failed:
+            st.warning(f"{failed} images could not be searched")
+        st.dataframe(df, use_container_width=True, hide_index=True)
+
+        csv_col, parquet_col = st.columns(2)
+        with csv_col:
+            st.download_button(
+                "Download CSV",
+                results_to_bytes(df, 'csv'),
+                file_name="visual_search_results.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
+        with parquet_col:
+            st.download_button(
+                "Download Parquet",
+                results_to_bytes(df, 'parquet'),
+                file_name="visual_search_results.parquet",
+                mime="application/octet-stream",
+                use_container_width=True
+            )
+
+
 def main():
     st.set_page_config(page_title="Visual Search", page_icon=":mag:")
+    start_services()
     st.markdown(
         """
         <style>
@@ -79,94 +341,11 @@ def main():
     
     st.markdown('<a href="/" class="nav-button">Back to Chat</a>', unsafe_allow_html=True)
 
-    st.markdown("""
-        <div style="padding: 1rem; background-color: #f0f2f6; border-radius: 0.5rem; margin-bottom: 1rem;">
-            ℹ️ Using default test image. You can upload your own image to search for similar products.
-        </div>
-    """, unsafe_allow_html=True)
-
-
-    with st.container():
-        col1, col2 = st.columns([1, 2])
-        
-        with col1:
-            uploaded_file = st.file_uploader(
-                "Upload Image",
-                type=['png', 'jpg', 'jpeg'],
-                help="Select an image to find similar video segments"
-            )
-
-            if not uploaded_file:
-                default_image = load_default_image()
-                if default_image:
-                    uploaded_file = default_image
-            if uploaded_file:
-                st.image(uploaded_file, use_container_width=True)
-        
-        with col2:
-            if uploaded_file:
-                st.subheader("Search Parameters")
-                top_k = st.slider(
-                    "Number of results",
-                    min_value=1,
-                    max_value=20,
-                    value=2,
-                    help="Select the number of similar videos to retrieve"
-                )
-                
-
-                slider_progress = (top_k - 1) / 19 * 100
-                st.markdown(
-                    f'''
-                    <style>
-                    div.stSlider > div[data-baseweb="slider"] > div > div {{
-                        background: linear-gradient(to right, #81E831 {slider_progress}%, rgba(151, 166, 195, 0.25) {slider_progress}%);
-                    }}
-                    </style>
-                    ''',
-                    unsafe_allow_html=True
-                )
-                
-                if st.button("Search", type="primary", use_container_width=True):
-                    with st.spinner("Searching for similar videos..."):
-                        results = search_similar_videos(uploaded_file, top_k=top_k)
-                        
-                        if not results:
-                            st.warning("No similar videos found")
-                        else:
-                            st.subheader("Results")
-                            for idx, result in enumerate(results, 1):
-                                with st.expander(f"Match #{idx} - Similarity: {result['Similarity']}", expanded=(idx==1)):
-                                    video_col, details_col = st.columns([2, 1])
-                                    
-                                    with video_col:
-                                        st.markdown("#### Video Segment")
-                                        video_embed = create_video_embed(
-                                            result['Video URL'],
-                                            float(result['Start Time'].replace('s', '')),
-                                            float(result['End Time'].replace('s', ''))
-                                        )
-                                        st.markdown(video_embed, unsafe_allow_html=True)
-                                    
-                                    with details_col:
-                                        st.markdown(f"""
-                                            #### Details
-                                            
-                                            📝 **Title**  
-                                            {result['Title']}
-                                            
-                                            📖 **Description**  
-                                            {result['Description']}
-                                            
-                                            🔗 **Link**  
-                                            [Open Product]({result['Link']})
-                                            
-                                            🕒 **Time Range**  
-                                            {result['Start Time']} - {result['End Time']}
-                                            
-                                            📊 **Similarity Score**  
-                                            {result['Similarity']}
-                                        """)
+    mode = st.radio("Search mode", ["Single image", "Batch"], horizontal=True, label_visibility="collapsed")
+    if mode == "Batch":
+        render_batch_search()
+    else:
+        render_single_search()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,131 @@
+import os
+import re
+import logging
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+CHAT_MODEL = "gpt-3.5-turbo"
+# Upper bound for system + user prompt tokens on every completion
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '900'))
+# Product descriptions are cut to this many tokens before entering the context
+DESCRIPTION_TOKEN_LIMIT = int(os.getenv('DESCRIPTION_TOKEN_LIMIT', '80'))
+# Chat format overhead per message
+MESSAGE_TOKEN_OVERHEAD = 4
+
+MAX_TOKENS_BY_QUERY_TYPE = {
+    "lookup": 250,
+    "compare": 400,
+    "advice": 500
+}
+
+SYSTEM_PROMPT = (
+    "You are a fashion advisor and shopping assistant. "
+    "Start with a brief, direct answer. Then describe the matching products: name, key features, "
+    "why each fits the request and how to style it. End with short extra style advice. "
+    "Be specific and natural, not promotional."
+)
+
+COMPARE_PATTERN = re.compile(r"\b(compare|comparison|vs\.?|versus|difference|better|which one)\b", re.IGNORECASE)
+ADVICE_PATTERN = re.compile(r"\b(how|why|should|advice|style|wear|pair|match|occasion|suggest|recommend|what goes)\b", re.IGNORECASE)
+
+_encoding = None
+if tiktoken is not None:
+    try:
+        _encoding = tiktoken.encoding_for_model(CHAT_MODEL)
+    except Exception:
+        _encoding = None
+
+
+# Count tokens with tiktoken, or estimate four characters per token without it
+def count_tokens(text):
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+# Cut text to at most max_tokens tokens, marking the cut with an ellipsis
+def truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens]).rstrip() + "…"
+    return text[:max_tokens * 4].rstrip() + "…"
+
+
+# Lookup queries get short answers, comparisons and styling advice longer ones
+def classify_query(question):
+    if COMPARE_PATTERN.search(question):
+        return "compare"
+    if ADVICE_PATTERN.search(question):
+        return "advice"
+    return "lookup"
+
+
+# Keep one entry per product, text hits first, in order of similarity
+def dedupe_products(text_docs, video_docs):
+    products = []
+    seen = set()
+    for doc in sorted(text_docs, key=lambda d: d.get("similarity", 0), reverse=True) + \
+            sorted(video_docs, key=lambda d: d.get("similarity", 0), reverse=True):
+        key = doc.get("product_id") or doc.get("title")
+        if key in seen:
+            continue
+        seen.add(key)
+        products.append(doc)
+    return products
+
+
+def format_product(doc):
+    description = truncate_to_tokens(doc.get("description", ""), DESCRIPTION_TOKEN_LIMIT)
+    return f"Product: {doc.get('title', 'Untitled')}\nDescription: {description}\nLink: {doc.get('link', '')}"
+
+
+# Build the chat messages within the prompt budget and pick max_tokens for the query
+def build_rag_prompt(question, text_docs, video_docs, budget=PROMPT_TOKEN_BUDGET):
+    query_type = classify_query(question)
+    header = f"Query: {question}\n\nAvailable Products:\n"
+    footer = "\n\nGive fashion advice and product recommendations based on these options."
+
+    used = (count_tokens(SYSTEM_PROMPT) + count_tokens(header) + count_tokens(footer)
+            + 2 * MESSAGE_TOKEN_OVERHEAD)
+    blocks = []
+    for doc in dedupe_products(text_docs, video_docs):
+        block = format_product(doc)
+        block_tokens = count_tokens(block) + 1
+        if blocks and used + block_tokens > budget:
+            break
+        blocks.append(block)
+        used += block_tokens
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": header + "\n\n".join(blocks) + footer}
+    ]
+    return {
+        "messages": messages,
+        "max_tokens": MAX_TOKENS_BY_QUERY_TYPE[query_type],
+        "query_type": query_type,
+        "prompt_tokens": used,
+        "products": len(blocks)
+    }
+
+
+# Log estimated and billed token counts for one completion
+def log_token_usage(prompt, chat_response):
+    usage = getattr(chat_response, "usage", None)
+    logger.info(
+        "RAG completion: type=%s products=%d prompt_tokens=%s (estimated %d) completion_tokens=%s max_tokens=%d",
+        prompt["query_type"],
+        prompt["products"],
+        getattr(usage, "prompt_tokens", "n/a"),
+        prompt["prompt_tokens"],
+        getattr(usage, "completion_tokens", "n/a"),
+        prompt["max_tokens"]
+    )
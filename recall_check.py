@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from pymilvus import Collection, connections
+from schema import SEARCH_PARAMS, RERANK_OVERFETCH, RERANK_SEARCH_PARAMS
+from search_results import rerank_exact
+from similar_items import normalize_rows
+from snapshot import load_snapshot_vectors, METADATA_FILE
+
+load_dotenv()
+COLLECTION_NAME = os.getenv('COLLECTION_NAME')
+
+RECALL_SAMPLES = int(os.getenv('RECALL_SAMPLES', '100'))
+RECALL_TOP_K = int(os.getenv('RECALL_TOP_K', '10'))
+# Snapshot rows scored per block during the brute-force ground truth
+RECALL_BLOCK_SIZE = int(os.getenv('RECALL_BLOCK_SIZE', '65536'))
+
+
+# Exact top-k ids by cosine for every query, scanning the memory-mapped snapshot one block at a time
+def exact_top_k(queries, vectors, ids, keep, top_k, block_size=RECALL_BLOCK_SIZE):
+    queries = normalize_rows(queries)
+    best_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), top_k), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block_rows = np.flatnonzero(keep[start:start + block_size]) + start
+        if not len(block_rows):
+            continue
+        block = normalize_rows(vectors[block_rows])
+        scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+        candidates = np.concatenate(
+            [best_ids, np.broadcast_to(ids[block_rows], (len(queries), len(block_rows)))], axis=1
+        )
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(candidates, top, axis=1)
+    return [set(row.tolist()) for row in best_ids]
+
+
+def ann_top_k(collection, queries, top_k, expr):
+    results = collection.search(data=queries.tolist(), anns_field="vector", param=SEARCH_PARAMS,
+                                limit=top_k, expr=expr, output_fields=[])
+    return [set(hit.id for hit in hits) for hits in results]
+
+
+def rerank_top_k(collection, queries, top_k, expr, overfetch):
+    results = collection.search(data=queries.tolist(), anns_field="vector", param=RERANK_SEARCH_PARAMS,
+                                limit=top_k * overfetch, expr=expr, output_fields=["vector"])
+    found = []
+    for query, hits in zip(queries, results):
+        ids, _ = rerank_exact(query, [hit.id for hit in hits], [hit.entity.get("vector") for hit in hits], top_k)
+        found.append(set(ids.tolist()))
+    return found
+
+
+# Recall@k of the nprobe=1024 search and of rerank mode, both against exact search over the snapshot.
+# The snapshot must be taken from the collection being checked, so row ids line up.
+def recall_check(snapshot_dir, collection_name, embedding_type="video", samples=RECALL_SAMPLES,
+                 top_k=RECALL_TOP_K, overfetch=RERANK_OVERFETCH, seed=0):
+    table = pq.read_table(os.path.join(snapshot_dir, METADATA_FILE), columns=["id", "embedding_type"])
+    keep = table.column("embedding_type").to_numpy(zero_copy_only=False) == embedding_type
+    if not keep.any():
+        raise ValueError(f"Snapshot has no {embedding_type} rows")
+    ids = table.column("id").to_numpy()
+    vectors = load_snapshot_vectors(snapshot_dir)
+
+    rows = np.flatnonzero(keep)
+    sample = np.sort(np.random.default_rng(seed).choice(rows, size=min(samples, len(rows)), replace=False))
+    queries = np.asarray(vectors[sample], dtype=np.float32)
+
+    collection = Collection(collection_name)
+    collection.load()
+    expr = f'embedding_type == "{embedding_type}"'
+    exact = exact_top_k(queries, vectors, ids, keep, top_k)
+    baseline = ann_top_k(collection, queries, top_k, expr)
+    reranked = rerank_top_k(collection, queries, top_k, expr, overfetch)
+
+    def recall(found, truth=exact):
+        return float(np.mean([len(hits & expected) / top_k for hits, expected in zip(found, truth)]))
+
+    index_type = next((index.params.get("index_type") for index in collection.indexes
+                       if index.field_name == "vector"), None)
+    return {
+        "collection": collection_name,
+        "index_type": index_type,
+        "embedding_type": embedding_type,
+        "queries": len(queries),
+        "top_k": top_k,
+        "baseline_recall": recall(baseline),
+        "rerank_recall": recall(reranked),
+        "rerank_vs_baseline": recall(reranked, baseline),
+        "rerank_overfetch": overfetch,
+        "rerank_nprobe": RERANK_SEARCH_PARAMS["params"]["nprobe"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure rerank-mode recall against the nprobe=1024 search")
+    parser.add_argument("snapshot_dir", help="Snapshot exported from the collection being checked")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--embedding-type", default="video", choices=["text", "video", "video_coarse"])
+    parser.add_argument("--samples", type=int, default=RECALL_SAMPLES)
+    parser.add_argument("--top-k", type=int, default=RECALL_TOP_K)
+    parser.add_argument("--overfetch", type=int, default=RERANK_OVERFETCH)
+    args = parser.parse_args()
+    connections.connect(uri=os.getenv('URL'), token=os.getenv('TOKEN'))
+
+    report = recall_check(args.snapshot_dir, args.collection, args.embedding_type,
+                          args.samples, args.top_k, args.overfetch)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import random
+import argparse
+from pymilvus import Collection, utility
+from twelvelabs import TwelveLabs
+from schema import create_collection, build_indexes, model_from_description
+from batch_search import RateLimiter
+from sharding import SHARD_COLLECTIONS
+from utils import (
+    COLLECTION_NAME, EMBEDDING_MODEL, CLIP_LENGTHS, TWELVELABS_API_KEY, SEARCH_PARAMS,
+    generate_embedding, insert_embeddings, quote_expr_value
+)
+
+PRODUCT_FIELDS = ["product_id", "title", "description", "link", "video_url", "category", "region"]
+# Products re-embedded per minute; keeps the re-index from starving live embed traffic
+REINDEX_RATE_PER_MINUTE = float(os.getenv('REINDEX_RATE_PER_MINUTE', '6'))
+RECALL_SAMPLE_SIZE = int(os.getenv('REINDEX_RECALL_SAMPLE', '20'))
+RECALL_TOP_K = int(os.getenv('REINDEX_RECALL_TOP_K', '5'))
+# How far shadow recall may fall below live recall before a swap is refused
+RECALL_TOLERANCE = float(os.getenv('REINDEX_RECALL_TOLERANCE', '0.05'))
+
+
+def checkpoint_path(shadow_name):
+    return f"reindex_{shadow_name}.json"
+
+
+def load_checkpoint(path, defaults):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return dict(defaults, done=[], failed={}, complete=False)
+
+
+# Write atomically so an interrupted run never leaves a half-written checkpoint
+def save_checkpoint(path, state):
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+# Collection an alias currently points to
+def resolve_alias(alias):
+    for name in utility.list_collections():
+        if alias in utility.list_aliases(name):
+            return name
+    return None
+
+
+# One entry per product, read from the text rows of a collection
+def list_products(collection):
+    iterator = collection.query_iterator(
+        batch_size=1000,
+        expr='embedding_type == "text"',
+        output_fields=PRODUCT_FIELDS
+    )
+    products = {}
+    while True:
+        batch = iterator.next()
+        if not batch:
+            iterator.close()
+            break
+        for row in batch:
+            products[row["product_id"]] = {
+                "product_id": row["product_id"],
+                "title": row["title"],
+                "desc": row["description"],
+                "link": row["link"],
+                "video_url": row["video_url"],
+                "category": row["category"],
+                "region": row["region"]
+            }
+    return list(products.values())
+
+
+# Re-embed every product of the live collection into the shadow, resuming from the checkpoint
+def build_shadow(alias, shadow_name, model_name, clip_lengths, rate_per_minute=REINDEX_RATE_PER_MINUTE):
+    path = checkpoint_path(shadow_name)
+    state = load_checkpoint(path, {
+        "alias": alias, "shadow": shadow_name, "model": model_name, "clip_lengths": clip_lengths
+    })
+
+    live = Collection(alias)
+    if utility.has_collection(shadow_name):
+        shadow = Collection(shadow_name)
+    else:
+        # The new model may not share the live collection's dimension, so ask the model itself
+        dim = len(embed_query(TwelveLabs(api_key=TWELVELABS_API_KEY), model_name, "dimension probe"))
+        shadow = create_collection(shadow_name, dim=dim, model_name=model_name)
+        # Index and load while empty so resumed runs can delete a product's partial rows by filter
+        build_indexes(shadow)
+    shadow.load()
+
+    products = list_products(live)
+    done = set(state["done"])
+    limiter = RateLimiter(rate_per_minute / 60)
+    for index, product in enumerate(products, 1):
+        if product["product_id"] in done:
+            continue
+        limiter.wait()
+        print(f"[{index}/{len(products)}] Re-embedding {product['product_id']} {product['title']}")
+
+        embeddings, error = generate_embedding(product, model_name=model_name, clip_lengths=clip_lengths)
+        if not error:
+            # Drop rows left by an interrupted attempt so a resumed product is not duplicated
+            shadow.delete(f"product_id == {quote_expr_value(product['product_id'])}")
+            if not insert_embeddings(embeddings, product, target_collection=shadow):
+                error = "insert failed"
+        if error:
+            state["failed"][product["product_id"]] = error
+        else:
+            state["done"].append(product["product_id"])
+            state["failed"].pop(product["product_id"], None)
+        save_checkpoint(path, state)
+
+    if not state["failed"]:
+        shadow.flush()
+        state["complete"] = True
+        save_checkpoint(path, state)
+    return state
+
+
+def embed_query(client, model_name, text):
+    return client.embed.create(model_name=model_name, text=text).text_embedding.segments[0].embeddings_float
+
+
+def top_products(collection, vector, top_k):
+    hits = collection.search(
+        data=[vector],
+        anns_field="vector",
+        param=SEARCH_PARAMS,
+        limit=top_k,
+        expr='embedding_type == "text"',
+        output_fields=["product_id"]
+    )[0]
+    return [hit.entity.get("product_id") for hit in hits]
+
+
+# Compare how often each collection finds a product from its own title
+def recall_spot_check(alias, shadow_name, sample_size=RECALL_SAMPLE_SIZE, top_k=RECALL_TOP_K):
+    live = Collection(alias)
+    shadow = Collection(shadow_name)
+    shadow.load()
+    live_model = model_from_description(live.description) or EMBEDDING_MODEL
+    shadow_model = model_from_description(shadow.description) or live_model
+    client = TwelveLabs(api_key=TWELVELABS_API_KEY)
+
+    products = list_products(live)
+    sample = random.sample(products, min(sample_size, len(products)))
+    live_hits = shadow_hits = overlap = 0.0
+    for product in sample:
+        query = product["title"]
+        live_top = top_products(live, embed_query(client, live_model, query), top_k)
+        shadow_top = top_products(shadow, embed_query(client, shadow_model, query), top_k)
+        live_hits += product["product_id"] in live_top
+        shadow_hits += product["product_id"] in shadow_top
+        overlap += len(set(live_top) & set(shadow_top)) / top_k
+
+    count = max(len(sample), 1)
+    return {
+        "sampled": len(sample),
+        "live_recall": live_hits / count,
+        "shadow_recall": shadow_hits / count,
+        "overlap": overlap / count,
+        "shadow_rows": shadow.num_entities
+    }
+
+
+# Move a live collection that is still addressed by its own name behind an alias of that name.
+# Milvus will not create an alias that matches an existing collection, so the collection is
+# renamed first; searches fail between the two calls, so run it in a quiet moment.
+def bootstrap_alias(alias, target_name):
+    if resolve_alias(alias):
+        raise RuntimeError(f"{alias} is already an alias of {resolve_alias(alias)}")
+    if not utility.has_collection(alias):
+        raise RuntimeError(f"No collection named {alias} to move behind an alias")
+    if utility.has_collection(target_name):
+        raise RuntimeError(f"Collection {target_name} already exists")
+    utility.rename_collection(alias, target_name)
+    utility.create_alias(collection_name=target_name, alias=alias)
+    Collection(target_name).load()
+    return target_name
+
+
+# Product ids served by the live collection that the shadow does not hold
+def missing_products(alias, shadow_name):
+    live_ids = {product["product_id"] for product in list_products(Collection(alias))}
+    shadow_ids = {product["product_id"] for product in list_products(Collection(shadow_name))}
+    return live_ids - shadow_ids
+
+
+# Point the alias at the shadow in one atomic call, keeping the old collection for rollback
+def swap_alias(alias, shadow_name, skip_check=False, tolerance=RECALL_TOLERANCE):
+    path = checkpoint_path(shadow_name)
+    state = load_checkpoint(path, {"alias": alias, "shadow": shadow_name})
+    if not skip_check:
+        if not state.get("complete"):
+            raise RuntimeError("Shadow collection is not fully built; run build until nothing fails")
+        report = recall_spot_check(alias, shadow_name)
+        print(json.dumps(report, indent=2))
+        if report["shadow_rows"] == 0 or report["shadow_recall"] < report["live_recall"] - tolerance:
+            raise RuntimeError("Shadow recall is below the live collection; not swapping")
+        state["recall_check"] = report
+
+    # Products inserted after the build read its product list would silently drop out of search
+    missing = missing_products(alias, shadow_name)
+    if missing:
+        raise RuntimeError(f"{len(missing)} live products are not in the shadow (e.g. {sorted(missing)[:5]}); "
+                           "run build again to add them, then swap")
+
+    previous = resolve_alias(alias)
+    if previous is None:
+        utility.create_alias(collection_name=shadow_name, alias=alias)
+    else:
+        utility.alter_alias(collection_name=shadow_name, alias=alias)
+    state["previous"] = previous
+    save_checkpoint(path, state)
+    return previous
+
+
+# Point the alias back at the collection it served before the last swap
+def rollback_alias(alias, shadow_name):
+    state = load_checkpoint(checkpoint_path(shadow_name), {})
+    previous = state.get("previous")
+    if not previous:
+        raise RuntimeError("No previous collection recorded for this re-index")
+    Collection(previous).load()
+    utility.alter_alias(collection_name=previous, alias=alias)
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed the catalog into a shadow collection and swap it in")
+    parser.add_argument("command", choices=["bootstrap", "build", "check", "swap", "rollback"])
+    parser.add_argument("--alias", default=COLLECTION_NAME, help="Alias that search serves from")
+    parser.add_argument("--shadow", required=True,
+                        help="Shadow collection to build or swap in; for bootstrap, the live collection's new name")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--coarse-clip", type=int, default=CLIP_LENGTHS["coarse"])
+    parser.add_argument("--fine-clip", type=int, default=CLIP_LENGTHS["fine"])
+    parser.add_argument("--rate", type=float, default=REINDEX_RATE_PER_MINUTE, help="Products per minute")
+    parser.add_argument("--skip-check", action="store_true", help="Swap without the recall spot-check")
+    args = parser.parse_args()
+    # Only one collection is re-embedded and swapped; a sharded catalog would lose every other shard
+    if SHARD_COLLECTIONS.strip():
+        parser.error("re-indexing swaps a single collection; SHARD_COLLECTIONS must be unset")
+
+    if args.command == "bootstrap":
+        bootstrap_alias(args.alias, args.shadow)
+        print(f"{args.alias} is now an alias of {args.shadow}")
+        return 0
+    if args.command == "build":
+        state = build_shadow(args.alias, args.shadow, args.model,
+                             {"coarse": args.coarse_clip, "fine": args.fine_clip}, args.rate)
+        print(f"Re-embedded {len(state['done'])} products, {len(state['failed'])} failed")
+        return 1 if state["failed"] else 0
+    if args.command == "check":
+        print(json.dumps(recall_spot_check(args.alias, args.shadow), indent=2))
+        return 0
+    if args.command == "swap":
+        previous = swap_alias(args.alias, args.shadow, skip_check=args.skip_check)
+        print(f"{args.alias} now serves {args.shadow}; previous collection {previous} kept for rollback")
+        return 0
+    previous = rollback_alias(args.alias, args.shadow)
+    print(f"{args.alias} rolled back to {previous}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# Base error for upstream calls that failed after the resilience policy gave up
+class UpstreamError(Exception):
+    pass
+
+
+# Raised when a call does not finish before its dependency deadline
+class DeadlineExceeded(UpstreamError, TimeoutError):
+    pass
+
+
+# Raised without calling the dependency while its circuit breaker is open
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+# Raised when the dependency answered but refused the request (4xx, validation); not retried
+class RequestRejected(UpstreamError):
+    pass
+
+
+# Raised without calling the dependency while all of its workers are busy
+class Overloaded(UpstreamError):
+    pass
+
+
+# Only timeouts, connection failures, 429 and 5xx say anything about upstream health
+RETRYABLE_ERROR_NAMES = ("Timeout", "Connection", "Unavailable", "RateLimit", "InternalServer")
+
+
+def error_status(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return any(marker in cls.__name__ for cls in type(error).__mro__ for marker in RETRYABLE_ERROR_NAMES)
+
+
+def _policy_value(dependency, key, default):
+    value = os.getenv(f"RESILIENCE_{dependency.upper()}_{key.upper()}")
+    if value is None:
+        return default
+    return type(default)(value) if not isinstance(default, bool) else value.lower() in ("1", "true", "yes")
+
+
+# Per-dependency defaults, each overridable with RESILIENCE_<DEPENDENCY>_<KEY>
+# concurrency bounds the calls in flight, counting ones abandoned at their deadline
+DEFAULT_POLICIES = {
+    "twelvelabs_embed": {"timeout": 10.0, "retries": 2, "hedge": True, "concurrency": 8},
+    # Batch embeds get their own workers and breaker; the batch runner retries them through its rate limiter
+    "twelvelabs_embed_batch": {"timeout": 10.0, "retries": 0, "hedge": False, "concurrency": 4},
+    "milvus_search": {"timeout": 5.0, "retries": 2, "hedge": True, "concurrency": 16},
+    "openai_completion": {"timeout": 30.0, "retries": 1, "hedge": False, "concurrency": 8},
+}
+DEFAULT_POLICY = {"timeout": 10.0, "retries": 1, "hedge": False, "concurrency": 8}
+
+# Shared knobs for retries, hedging and breakers
+RETRY_BASE_DELAY = float(os.getenv('RESILIENCE_RETRY_BASE_DELAY', '0.2'))
+RETRY_MAX_DELAY = float(os.getenv('RESILIENCE_RETRY_MAX_DELAY', '2.0'))
+RETRY_BUDGET_RATIO = float(os.getenv('RESILIENCE_RETRY_BUDGET_RATIO', '0.2'))
+RETRY_BUDGET_MIN = float(os.getenv('RESILIENCE_RETRY_BUDGET_MIN', '10'))
+HEDGE_MIN_SAMPLES = int(os.getenv('RESILIENCE_HEDGE_MIN_SAMPLES', '20'))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('RESILIENCE_BREAKER_FAILURES', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('RESILIENCE_BREAKER_RESET', '30'))
+LATENCY_WINDOW = 200
+
+
+# Sliding window of recent successful latencies
+class LatencyTracker:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct):
+        with self.lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+# Retries are only allowed while they stay a fixed fraction of regular traffic
+class RetryBudget:
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, minimum=RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.maximum = minimum
+        self.tokens = minimum
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.maximum, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+# Closed -> open after consecutive failures, half-open probe after the reset timeout
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+# Policy, state and counters for one upstream dependency
+class Dependency:
+    def __init__(self, name):
+        # "milvus_search:<shard>" shares the milvus_search policy but keeps its own breaker
+        base_name = name.split(":")[0]
+        defaults = DEFAULT_POLICIES.get(base_name, DEFAULT_POLICY)
+        self.name = name
+        self.timeout = _policy_value(base_name, "timeout", defaults["timeout"])
+        self.retries = _policy_value(base_name, "retries", defaults["retries"])
+        self.hedge = _policy_value(base_name, "hedge", defaults["hedge"])
+        self.concurrency = _policy_value(base_name, "concurrency", defaults["concurrency"])
+        # Each dependency has its own workers, so a stalled upstream cannot starve the others
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"upstream-{name}")
+        self.in_flight = 0
+        self.latency = LatencyTracker()
+        self.budget = RetryBudget()
+        self.breaker = CircuitBreaker()
+        self.counters = {
+            "calls": 0, "successes": 0, "failures": 0, "timeouts": 0,
+            "retries": 0, "budget_exhausted": 0, "hedges": 0, "hedge_wins": 0,
+            "short_circuits": 0, "rejected": 0, "shed": 0
+        }
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    # Submit to this dependency's workers, or return None when every worker is busy
+    def submit(self, fn, args, kwargs):
+        with self.lock:
+            if self.in_flight >= self.concurrency:
+                return None
+            self.in_flight += 1
+        future = self.executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self.lock:
+            self.in_flight -= 1
+
+    # Run one attempt, firing a duplicate request if it outlives the p95 latency
+    def attempt(self, fn, args, kwargs, remaining):
+        started = time.monotonic()
+        first = self.submit(fn, args, kwargs)
+        if first is None:
+            # Calls abandoned at their deadline still hold workers; shed instead of queueing behind them
+            self.count("shed")
+            raise Overloaded(f"{self.name} has {self.concurrency} calls in flight")
+        futures = [first]
+        hedge_after = self.latency.percentile(95) if self.hedge and len(self.latency) >= HEDGE_MIN_SAMPLES else None
+
+        if hedge_after is not None and hedge_after < remaining:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                hedge = self.submit(fn, args, kwargs)
+                if hedge is not None:
+                    self.count("hedges")
+                    futures.append(hedge)
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            timeout = remaining - (time.monotonic() - started)
+            if timeout <= 0:
+                break
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self.count("hedge_wins")
+                    self.latency.record(time.monotonic() - started)
+                    return future.result()
+                last_error = future.exception()
+
+        if last_error is not None and not pending:
+            raise last_error
+        self.count("timeouts")
+        raise DeadlineExceeded(f"{self.name} did not respond within {remaining:.1f}s")
+
+    def call(self, fn, *args, **kwargs):
+        self.count("calls")
+        if not self.breaker.allow():
+            self.count("short_circuits")
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+        self.budget.deposit()
+
+        deadline = time.monotonic() + self.timeout
+        attempt_number = 0
+        while True:
+            try:
+                result = self.attempt(fn, args, kwargs, deadline - time.monotonic())
+                self.count("successes")
+                self.breaker.record_success()
+                return result
+            except Overloaded:
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    return self._reject(e)
+                remaining = deadline - time.monotonic()
+                if attempt_number >= self.retries or remaining <= 0:
+                    return self._give_up(e)
+                if not self.budget.withdraw():
+                    self.count("budget_exhausted")
+                    return self._give_up(e)
+                attempt_number += 1
+                self.count("retries")
+                # Full jitter keeps retries from synchronizing across sessions
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt_number))
+                if delay >= remaining:
+                    return self._give_up(e)
+                time.sleep(delay)
+
+    # The dependency answered, so the breaker sees a healthy call and the caller gets the refusal
+    def _reject(self, error):
+        self.count("rejected")
+        self.breaker.record_success()
+        if isinstance(error, UpstreamError):
+            raise error
+        raise RequestRejected(f"{self.name} rejected the request: {error}") from error
+
+    def _give_up(self, error):
+        self.count("failures")
+        self.breaker.record_failure()
+        if isinstance(error, UpstreamError):
+            raise error
+        raise UpstreamError(f"{self.name} failed: {error}") from error
+
+    def metrics(self):
+        with self.lock:
+            snapshot = dict(self.counters)
+        snapshot.update({
+            "dependency": self.name,
+            "breaker": self.breaker.state,
+            "retry_tokens": round(self.budget.tokens, 2),
+            "in_flight": self.in_flight,
+            "p50_ms": _to_ms(self.latency.percentile(50)),
+            "p95_ms": _to_ms(self.latency.percentile(95)),
+            "p99_ms": _to_ms(self.latency.percentile(99)),
+        })
+        return snapshot
+
+
+def _to_ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+_dependencies = {}
+_dependencies_lock = threading.Lock()
+
+
+def get_dependency(name):
+    with _dependencies_lock:
+        if name not in _dependencies:
+            _dependencies[name] = Dependency(name)
+        return _dependencies[name]
+
+
+# Call an upstream dependency under its deadline, retry, hedging and breaker policy
+def call_with_resilience(name, fn, *args, **kwargs):
+    return get_dependency(name).call(fn, *args, **kwargs)
+
+
+# Metrics for every dependency called so far in this process
+def get_metrics():
+    with _dependencies_lock:
+        dependencies = list(_dependencies.values())
+    return [dependency.metrics() for dependency in dependencies]
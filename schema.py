@@ -0,0 +1,134 @@
+import os
+from pymilvus import Collection, CollectionSchema, FieldSchema, DataType, utility
+
+# Marengo-retrieval-2.7 embedding size
+EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', '1024'))
+
+# IVF_FLAT keeps full-precision vectors in the index. IVF_SQ8 (8-bit codes, a quarter of the
+# memory) and IVF_PQ trade score accuracy for size and are meant for SEARCH_MODE=rerank, which
+# re-scores the candidates with the raw vectors Milvus stores beside the index
+VECTOR_INDEX_TYPE = os.getenv('VECTOR_INDEX_TYPE', 'IVF_FLAT')
+VECTOR_INDEX_PARAMS = {
+    "index_type": VECTOR_INDEX_TYPE,
+    "metric_type": "COSINE",
+    "params": {"nlist": 1024}
+}
+if VECTOR_INDEX_TYPE == "IVF_PQ":
+    VECTOR_INDEX_PARAMS["params"]["m"] = int(os.getenv('VECTOR_INDEX_PQ_M', '64'))
+
+# ANN parameters shared by every search
+SEARCH_PARAMS = {
+    "metric_type": "COSINE",
+    "params": {
+        "nprobe": 1024,
+        "ef": 64
+    }
+}
+
+# Rerank mode over-fetches this many times the requested hits with a cheaper probe.
+# Each candidate returns its raw vector (4 KB at 1024 dims), so keep the factor small.
+RERANK_OVERFETCH = int(os.getenv('RERANK_OVERFETCH', '4'))
+RERANK_SEARCH_PARAMS = {
+    "metric_type": "COSINE",
+    "params": {
+        "nprobe": int(os.getenv('RERANK_NPROBE', '64')),
+        "ef": int(os.getenv('RERANK_EF', '32'))
+    }
+}
+
+# Typed attributes stored next to each vector, with their VARCHAR lengths
+STRING_FIELDS = {
+    "embedding_type": 32,
+    "product_id": 64,
+    "title": 512,
+    "description": 4096,
+    "link": 1024,
+    "video_url": 1024,
+    "category": 64,
+    "region": 64,
+    "resolution": 16
+}
+FLOAT_FIELDS = ["start_time", "end_time"]
+SCALAR_FIELDS = list(STRING_FIELDS) + FLOAT_FIELDS
+
+# Fields shown on result cards, served from the metadata cache instead of search output
+CARD_FIELDS = ["product_id", "title", "description", "link", "video_url", "category",
+               "resolution", "start_time", "end_time"]
+
+# Scalar indexes on the attributes used in filter expressions
+SCALAR_INDEXES = {
+    "embedding_type": "INVERTED",
+    "product_id": "INVERTED",
+    "category": "INVERTED",
+    "video_url": "INVERTED",
+    "start_time": "STL_SORT"
+}
+
+
+SCHEMA_DESCRIPTION = "Fashion product text and video segment embeddings"
+MODEL_MARKER = "embedding_model="
+
+
+# Collection description recording the embedding model its vectors came from
+def describe_model(model_name):
+    return f"{SCHEMA_DESCRIPTION}; {MODEL_MARKER}{model_name}"
+
+
+def model_from_description(description):
+    if MODEL_MARKER not in (description or ""):
+        return None
+    return description.split(MODEL_MARKER, 1)[1].split(";")[0].strip()
+
+
+def build_schema(dim=EMBEDDING_DIM, model_name=None):
+    fields = [
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=dim)
+    ]
+    fields += [FieldSchema(name=name, dtype=DataType.VARCHAR, max_length=length)
+               for name, length in STRING_FIELDS.items()]
+    fields += [FieldSchema(name=name, dtype=DataType.FLOAT) for name in FLOAT_FIELDS]
+    description = describe_model(model_name) if model_name else SCHEMA_DESCRIPTION
+    return CollectionSchema(fields, description=description)
+
+
+# Milvus counts VARCHAR max_length in UTF-8 bytes; cut there without splitting a character
+def clip_utf8(text, max_bytes):
+    encoded = text.encode("utf-8")
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode("utf-8", errors="ignore")
+
+
+# Fill every scalar field so rows match the schema, clipping strings to their max length
+def make_row(row_id, vector, attributes):
+    row = {"id": row_id, "vector": vector}
+    for name, length in STRING_FIELDS.items():
+        row[name] = clip_utf8(str(attributes.get(name) or ""), length)
+    for name in FLOAT_FIELDS:
+        row[name] = float(attributes.get(name) or 0)
+    return row
+
+
+# Convert a row of the old schema, where attributes lived in one metadata JSON blob
+def legacy_row_to_typed(row):
+    attributes = dict(row.get("metadata") or {})
+    attributes["embedding_type"] = row["embedding_type"]
+    return make_row(row["id"], row["vector"], attributes)
+
+
+# Create an empty collection; indexes are built separately so bulk loads write unindexed
+def create_collection(name, dim=EMBEDDING_DIM, using="default", model_name=None):
+    if utility.has_collection(name, using=using):
+        raise ValueError(f"Collection {name} already exists")
+    return Collection(name, schema=build_schema(dim, model_name), using=using)
+
+
+# Build the vector and scalar indexes once the data is in, then load for search
+def build_indexes(collection):
+    collection.flush()
+    collection.create_index(field_name="vector", index_params=VECTOR_INDEX_PARAMS)
+    for field_name, index_type in SCALAR_INDEXES.items():
+        collection.create_index(field_name=field_name, index_params={"index_type": index_type},
+                                index_name=f"{field_name}_idx")
+    collection.load()
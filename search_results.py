@@ -0,0 +1,129 @@
+import numpy as np
+
+
+# One search hit, materialized from a result set row
+class SearchHit:
+    __slots__ = (
+        'id', 'score', 'similarity', 'start_time', 'end_time', 'kind',
+        'product_id', 'title', 'description', 'link', 'video_url'
+    )
+
+    def __init__(self, result_set, index):
+        metadata = result_set.metadata[index]
+        self.id = int(result_set.ids[index])
+        self.score = float(result_set.scores[index])
+        self.similarity = float(result_set.similarity[index])
+        self.start_time = float(result_set.start_times[index])
+        self.end_time = float(result_set.end_times[index])
+        self.kind = result_set.kind
+        self.product_id = metadata.get('product_id', '')
+        self.title = metadata.get('title', '')
+        self.description = metadata.get('description', '')
+        self.link = metadata.get('link', '')
+        self.video_url = metadata.get('video_url', '')
+
+    # Source dict stored in chat history and rendered by the product cards
+    def to_source(self):
+        source = {
+            "title": self.title or 'Untitled',
+            "description": self.description or 'No description available',
+            "product_id": self.product_id,
+            "video_url": self.video_url,
+            "link": self.link,
+            "similarity": round(self.similarity, 2),
+            "raw_score": self.score,
+            "type": self.kind
+        }
+        if self.kind == "video":
+            source["start_time"] = self.start_time
+            source["end_time"] = self.end_time
+        return source
+
+
+# Hits for one query, kept as NumPy columns and sorted by score
+class SearchResultSet:
+    __slots__ = ('ids', 'scores', 'start_times', 'end_times', 'metadata', 'kind', '_similarity')
+
+    def __init__(self, ids, scores, start_times, end_times, metadata, kind):
+        self.ids = ids
+        self.scores = scores
+        self.start_times = start_times
+        self.end_times = end_times
+        self.metadata = metadata
+        self.kind = kind
+        self._similarity = None
+
+    # Build from one pymilvus Hits list and the card fields looked up by row id
+    @classmethod
+    def from_hits(cls, hits, kind, metadata_by_id):
+        ids = np.fromiter((hit.id for hit in hits), dtype=np.int64, count=len(hits))
+        scores = np.fromiter((hit.score for hit in hits), dtype=np.float32, count=len(hits))
+        return cls.from_arrays(ids, scores, kind, metadata_by_id)
+
+    @classmethod
+    def from_arrays(cls, ids, scores, kind, metadata_by_id):
+        count = len(ids)
+        start_times = np.zeros(count, dtype=np.float32)
+        end_times = np.zeros(count, dtype=np.float32)
+        metadata = []
+        for i, row_id in enumerate(ids.tolist()):
+            entry = metadata_by_id.get(row_id, {})
+            start_times[i] = entry.get('start_time', 0) or 0
+            end_times[i] = entry.get('end_time', 0) or 0
+            metadata.append(entry)
+        return cls(ids, scores, start_times, end_times, metadata, kind).sorted()
+
+    @classmethod
+    def empty(cls, kind):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32),
+                   np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32), [], kind)
+
+    # Cosine score mapped from [-1, 1] to a [0, 100] similarity, for all hits at once
+    @property
+    def similarity(self):
+        if self._similarity is None:
+            self._similarity = np.clip((self.scores + 1) * 50, 0, 100)
+        return self._similarity
+
+    def take(self, order):
+        return SearchResultSet(
+            self.ids[order], self.scores[order], self.start_times[order],
+            self.end_times[order], [self.metadata[i] for i in order], self.kind
+        )
+
+    def sorted(self):
+        return self.take(np.argsort(-self.scores, kind='stable'))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        return SearchHit(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.ids)):
+            yield SearchHit(self, index)
+
+    def to_sources(self):
+        return [hit.to_source() for hit in self]
+
+
+# Exact cosine scores for ANN candidates, returning the ids and scores of the requested slice
+def rerank_exact(query_vector, candidate_ids, candidate_vectors, limit, offset=0):
+    if len(candidate_ids) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+    vectors = np.asarray(candidate_vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    scores = (vectors @ query) / np.maximum(norms, 1e-12)
+    order = np.argsort(-scores, kind='stable')[offset:offset + limit]
+    return np.asarray(candidate_ids, dtype=np.int64)[order], scores[order].astype(np.float32)
+
+
+# Render-time formatting, kept out of the search path
+def format_similarity(similarity):
+    return f"{round(similarity, 2)}%"
+
+
+def format_seconds(seconds):
+    return f"{seconds:.1f}s"
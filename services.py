@@ -0,0 +1,22 @@
+import streamlit as st
+from warmup import start_warmup
+from clip_server import start_clip_server
+
+
+# Warm connections, refresh the keyword index and coarse coverage, and precompute suggestion
+# answers once per server process, whichever page a session opens first
+@st.cache_resource
+def warmup_thread():
+    return start_warmup()
+
+
+# Serve matched segments from the clip cache with HTTP range support
+@st.cache_resource
+def clip_server():
+    return start_clip_server()
+
+
+# Every page calls this before rendering; the resources are shared, so only the first call starts anything
+def start_services():
+    warmup_thread()
+    clip_server()
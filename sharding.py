@@ -0,0 +1,133 @@
+import os
+import zlib
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pymilvus import connections, Collection
+from resilience import call_with_resilience, UpstreamError
+
+logger = logging.getLogger(__name__)
+
+# Comma separated shards as [key=]collection[@uri]; empty means the single COLLECTION_NAME
+SHARD_COLLECTIONS = os.getenv('SHARD_COLLECTIONS', '')
+# How writes pick a shard: hash of product_id, or the product's category or region
+SHARD_STRATEGY = os.getenv('SHARD_STRATEGY', 'hash')
+DEFAULT_SHARD_KEY = "*"
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('SHARD_SEARCH_WORKERS', '8')),
+                               thread_name_prefix="shard")
+
+
+# One collection, possibly on its own cluster
+class Shard:
+    def __init__(self, name, key=None, uri=None, token=None):
+        self.name = name
+        self.key = key
+        self.alias = "default"
+        if uri:
+            self.alias = f"shard_{name}"
+            connections.connect(alias=self.alias, uri=uri, token=token)
+        self.collection = Collection(name, using=self.alias)
+        # Collections from before the typed schema keep attributes in one metadata JSON field
+        if "product_id" not in {field.name for field in self.collection.schema.fields}:
+            raise RuntimeError(
+                f"Collection {name} uses the old metadata JSON schema. Run "
+                f"`python migrate_schema.py --source {name} --target <new name>` and point "
+                f"COLLECTION_NAME (or SHARD_COLLECTIONS) at the new collection before starting the app"
+            )
+
+    def search(self, **search_kwargs):
+        return call_with_resilience(f"milvus_search:{self.name}", self.collection.search, **search_kwargs)
+
+    def query(self, **query_kwargs):
+        return call_with_resilience(f"milvus_search:{self.name}", self.collection.query, **query_kwargs)
+
+
+# Routes writes to one shard and fans searches out to all of them
+class ShardRouter:
+    def __init__(self, shards, strategy="hash"):
+        self.shards = shards
+        self.strategy = strategy
+        self.by_key = {shard.key: shard for shard in shards if shard.key}
+
+    @classmethod
+    def from_env(cls, default_collection, uri=None, token=None):
+        specs = [spec.strip() for spec in SHARD_COLLECTIONS.split(",") if spec.strip()]
+        if not specs:
+            return cls([Shard(default_collection)])
+
+        shards = []
+        for spec in specs:
+            # The URI may contain "=" in its query string, so split it off before looking for a key
+            head, _, shard_uri = spec.partition("@")
+            key, _, name = head.rpartition("=")
+            # Shards on the default cluster share its connection
+            if shard_uri == uri:
+                shard_uri = None
+            shards.append(Shard(name, key=key or None, uri=shard_uri, token=token))
+        return cls(shards, strategy=SHARD_STRATEGY)
+
+    def load(self):
+        for shard in self.shards:
+            shard.collection.load()
+
+    def _hash_shard(self, product_id):
+        return self.shards[zlib.crc32(str(product_id).encode()) % len(self.shards)]
+
+    # Shard that stores all rows of a product
+    def route(self, product_info):
+        if self.strategy in ("category", "region"):
+            key = product_info.get(self.strategy)
+            if key in self.by_key:
+                return self.by_key[key]
+            if DEFAULT_SHARD_KEY in self.by_key:
+                return self.by_key[DEFAULT_SHARD_KEY]
+        return self._hash_shard(product_info['product_id'])
+
+    # Shards a search has to visit, narrowed when the filter pins the routing key
+    def shards_for(self, filters=None):
+        filters = filters or {}
+        if self.strategy == "hash" and filters.get("product_id"):
+            return [self._hash_shard(filters["product_id"])]
+        if self.strategy in ("category", "region") and filters.get(self.strategy) in self.by_key:
+            return [self.by_key[filters[self.strategy]]]
+        return self.shards
+
+    # Search every shard in parallel and merge the per-shard top-k per query with a heap
+    def search(self, filters=None, **search_kwargs):
+        shards = self.shards_for(filters)
+        if len(shards) == 1:
+            return shards[0].search(**search_kwargs)
+
+        # A global offset needs every shard's first offset + limit hits before slicing
+        limit = search_kwargs.get("limit", 10)
+        offset = search_kwargs.pop("offset", 0) or 0
+        shard_kwargs = dict(search_kwargs, limit=offset + limit)
+
+        futures = [(shard, _executor.submit(shard.search, **shard_kwargs)) for shard in shards]
+        shard_results = []
+        errors = []
+        for shard, future in futures:
+            try:
+                shard_results.append(future.result())
+            except Exception as e:
+                logger.warning("Shard %s failed: %s", shard.name, e)
+                errors.append(e)
+
+        # Partial results beat no results; only fail when every shard did
+        if not shard_results:
+            raise errors[0] if isinstance(errors[0], UpstreamError) else UpstreamError(str(errors[0]))
+
+        query_count = len(search_kwargs["data"])
+        return [
+            heapq.nlargest(offset + limit, (hit for results in shard_results for hit in results[i]),
+                           key=lambda hit: hit.score)[offset:]
+            for i in range(query_count)
+        ]
+
+    # Run a scalar query on every shard in parallel and concatenate the rows
+    def query(self, **query_kwargs):
+        if len(self.shards) == 1:
+            return self.shards[0].query(**query_kwargs)
+        futures = [_executor.submit(shard.query, **query_kwargs) for shard in self.shards]
+        return [row for future in futures for row in future.result()]
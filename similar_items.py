@@ -0,0 +1,263 @@
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+# "More like this" neighbours per product, computed offline from the product-level text vectors
+SIMILAR_ITEMS_PATH = os.getenv('SIMILAR_ITEMS_PATH', 'similar_items.npz')
+SIMILAR_ITEMS_K = int(os.getenv('SIMILAR_ITEMS_K', '5'))
+# Rows and columns per similarity block; peak memory is block_size^2 floats
+SIMILAR_BLOCK_SIZE = int(os.getenv('SIMILAR_BLOCK_SIZE', '2048'))
+# Products added since the last full save live in an append-only delta file next to the graph;
+# once it holds this many entries the next add folds it into the .npz
+SIMILAR_DELTA_MAX = int(os.getenv('SIMILAR_DELTA_MAX', '500'))
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# Top-k cosine neighbours of every row, one block pair at a time so memory stays bounded
+def build_knn_graph(vectors, k=SIMILAR_ITEMS_K, block_size=SIMILAR_BLOCK_SIZE):
+    vectors = normalize_rows(vectors)
+    count = len(vectors)
+    # Catalogs smaller than k + 1 leave the trailing slots empty, marked by a -inf score
+    neighbors = np.zeros((count, k), dtype=np.int32)
+    scores = np.full((count, k), -np.inf, dtype=np.float16)
+    width = max(min(k, count - 1), 0)
+    if width == 0:
+        return neighbors, scores
+
+    for row_start in range(0, count, block_size):
+        rows = vectors[row_start:row_start + block_size]
+        best_scores = np.full((len(rows), width), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(rows), width), dtype=np.int64)
+        for col_start in range(0, count, block_size):
+            sims = rows @ vectors[col_start:col_start + block_size].T
+            # A product is not its own neighbour
+            self_cols = np.arange(len(rows)) + row_start - col_start
+            on_block = (self_cols >= 0) & (self_cols < sims.shape[1])
+            sims[np.nonzero(on_block)[0], self_cols[on_block]] = -np.inf
+
+            candidate_scores = np.concatenate([best_scores, sims], axis=1)
+            candidate_ids = np.concatenate([
+                best_ids,
+                np.broadcast_to(np.arange(col_start, col_start + sims.shape[1]), sims.shape)
+            ], axis=1)
+            top = np.argpartition(-candidate_scores, width - 1, axis=1)[:, :width]
+            best_scores = np.take_along_axis(candidate_scores, top, axis=1)
+            best_ids = np.take_along_axis(candidate_ids, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        neighbors[row_start:row_start + len(rows), :width] = np.take_along_axis(best_ids, order, axis=1)
+        scores[row_start:row_start + len(rows), :width] = np.take_along_axis(best_scores, order, axis=1)
+    return neighbors, scores
+
+
+# In-memory adjacency arrays, served to result cards and extended as products are added
+class SimilarItems:
+    def __init__(self, product_ids, titles, vectors, neighbors, scores, k=SIMILAR_ITEMS_K):
+        self.k = k
+        self.product_ids = list(product_ids)
+        self.titles = list(titles)
+        self.vectors = np.asarray(vectors, dtype=np.float16)
+        self.neighbors = np.asarray(neighbors, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float16)
+        self.index = {product_id: i for i, product_id in enumerate(self.product_ids)}
+        self.lock = threading.Lock()
+        self.path = None
+        self.mtime = None
+        self.delta_offset = 0
+        self.delta_entries = 0
+
+    @classmethod
+    def build(cls, product_ids, titles, vectors, k=SIMILAR_ITEMS_K, block_size=SIMILAR_BLOCK_SIZE):
+        vectors = normalize_rows(vectors)
+        neighbors, scores = build_knn_graph(vectors, k, block_size)
+        return cls(product_ids, titles, vectors, neighbors, scores, k)
+
+    @classmethod
+    def empty(cls, k=SIMILAR_ITEMS_K):
+        return cls([], [], np.zeros((0, 0)), np.zeros((0, k)), np.zeros((0, k)), k)
+
+    # Load the persisted graph plus any products added since, or start empty when the batch job has not run yet
+    @classmethod
+    def load(cls, path=SIMILAR_ITEMS_PATH):
+        if not os.path.exists(path):
+            items = cls.empty()
+        else:
+            with np.load(path) as data:
+                items = cls(data["product_ids"].tolist(), data["titles"].tolist(), data["vectors"],
+                            data["neighbors"], data["scores"], int(data["k"]))
+            items.mtime = os.stat(path).st_mtime_ns
+        items.path = path
+        items._replay_delta()
+        return items
+
+    def _delta_path(self):
+        return (self.path or SIMILAR_ITEMS_PATH) + ".delta"
+
+    # Serializes writers across processes; readers only take it when the files have changed
+    @contextmanager
+    def _file_lock(self):
+        with open((self.path or SIMILAR_ITEMS_PATH) + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Apply delta entries written since this instance last read the file
+    def _replay_delta(self):
+        delta_path = self._delta_path()
+        if not os.path.exists(delta_path):
+            return
+        with open(delta_path) as f:
+            f.seek(self.delta_offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                entry = json.loads(line)
+                self.add(entry["product_id"], entry["title"], entry["vector"])
+                self.delta_offset += len(line.encode())
+                self.delta_entries += 1
+
+    def _base_changed(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        return os.stat(self.path).st_mtime_ns != self.mtime
+
+    def _delta_grew(self):
+        delta_path = self._delta_path()
+        return os.path.exists(delta_path) and os.path.getsize(delta_path) > self.delta_offset
+
+    # Pick up a graph rebuilt by the batch job, or products another process added
+    def reload_if_changed(self):
+        if not self._base_changed() and not self._delta_grew():
+            return False
+        with self._file_lock():
+            self._catch_up()
+        return True
+
+    def _catch_up(self):
+        if self._base_changed():
+            fresh = SimilarItems.load(self.path)
+            with self.lock:
+                self.k = fresh.k
+                self.product_ids, self.titles, self.index = fresh.product_ids, fresh.titles, fresh.index
+                self.vectors, self.neighbors, self.scores = fresh.vectors, fresh.neighbors, fresh.scores
+                self.mtime = fresh.mtime
+                self.delta_offset, self.delta_entries = fresh.delta_offset, fresh.delta_entries
+        else:
+            self._replay_delta()
+
+    # Link a product into the graph and record it in the delta file, after catching up with other
+    # writers so their products are neighbours too. Costs one pass over the vectors, not a full save.
+    def append(self, product_id, title, vector):
+        with self._file_lock():
+            self._catch_up()
+            self.add(product_id, title, vector)
+            entry = {"product_id": product_id, "title": title,
+                     "vector": np.asarray(vector, dtype=np.float32).tolist()}
+            with open(self._delta_path(), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                self.delta_offset = f.tell()
+            self.delta_entries += 1
+            if self.delta_entries >= SIMILAR_DELTA_MAX:
+                self._write()
+
+    # Fold the delta into the .npz, e.g. after the batch job rebuilt the graph from the collection.
+    # Entries added during the rebuild are replayed first so they are not lost.
+    def save(self, path=None):
+        self.path = path or self.path or SIMILAR_ITEMS_PATH
+        with self._file_lock():
+            self._replay_delta()
+            self._write()
+
+    # Write atomically next to the target so readers never see a partial file, then empty the delta
+    def _write(self):
+        tmp_path = self.path + ".part.npz"
+        with self.lock:
+            np.savez(
+                tmp_path,
+                product_ids=np.asarray(self.product_ids, dtype=str),
+                titles=np.asarray(self.titles, dtype=str),
+                vectors=self.vectors,
+                neighbors=self.neighbors,
+                scores=self.scores,
+                k=np.asarray(self.k)
+            )
+        os.replace(tmp_path, self.path)
+        open(self._delta_path(), "w").close()
+        self.mtime = os.stat(self.path).st_mtime_ns
+        self.delta_offset = 0
+        self.delta_entries = 0
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    # Neighbours of one product as card-ready dicts, straight from the adjacency arrays
+    def get(self, product_id, limit=None):
+        with self.lock:
+            row = self.index.get(product_id)
+            if row is None:
+                return []
+            neighbors = self.neighbors[row][:limit]
+            scores = self.scores[row][:limit]
+            return [
+                {
+                    "product_id": self.product_ids[neighbor],
+                    "title": self.titles[neighbor],
+                    "similarity": round(float(np.clip((score + 1) * 50, 0, 100)), 2)
+                }
+                for neighbor, score in zip(neighbors.tolist(), scores.astype(np.float32).tolist())
+                if np.isfinite(score)
+            ]
+
+    # Link a new product into the graph with one pass over the existing vectors
+    def add(self, product_id, title, vector):
+        vector = normalize_rows(vector)
+        with self.lock:
+            if self.vectors.size and self.vectors.shape[1] != vector.shape[0]:
+                raise ValueError("Vector dimension does not match the similar-items graph")
+            row = self.index.get(product_id)
+            if row is None:
+                row = len(self.product_ids)
+                self.product_ids.append(product_id)
+                self.titles.append(title)
+                self.index[product_id] = row
+                self.vectors = np.vstack([self.vectors.reshape(row, vector.shape[0]), vector.astype(np.float16)])
+                self.neighbors = np.vstack([self.neighbors, np.zeros((1, self.k), dtype=np.int32)])
+                self.scores = np.vstack([self.scores, np.full((1, self.k), -np.inf, dtype=np.float16)])
+            else:
+                self.titles[row] = title
+                self.vectors[row] = vector.astype(np.float16)
+
+            sims = self.vectors.astype(np.float32) @ vector
+            sims[row] = -np.inf
+            width = min(self.k, len(sims) - 1)
+            top = np.argsort(-sims, kind='stable')[:width]
+            self.neighbors[row] = 0
+            self.scores[row] = -np.inf
+            self.neighbors[row, :width] = top
+            self.scores[row, :width] = sims[top]
+
+            # Refresh scores that point at this product, then let it displace weaker neighbours
+            holds = (self.neighbors == row) & np.isfinite(self.scores)
+            self.scores[holds] = np.broadcast_to(sims[:, None], holds.shape)[holds]
+            scores = self.scores.astype(np.float32)
+            weakest = np.argmin(scores, axis=1)
+            improved = (sims > scores[np.arange(len(sims)), weakest]) & ~holds.any(axis=1)
+            improved[row] = False
+            others = np.nonzero(improved)[0]
+            self.neighbors[others, weakest[others]] = row
+            self.scores[others, weakest[others]] = sims[others]
+
+            touched = np.nonzero(improved | holds.any(axis=1))[0]
+            order = np.argsort(-self.scores[touched].astype(np.float32), axis=1, kind='stable')
+            self.neighbors[touched] = np.take_along_axis(self.neighbors[touched], order, axis=1)
+            self.scores[touched] = np.take_along_axis(self.scores[touched], order, axis=1)
@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from pymilvus import Collection, connections
+from schema import create_collection, build_indexes, make_row, model_from_description, STRING_FIELDS, FLOAT_FIELDS, SCALAR_FIELDS
+
+# Read straight from the environment so the CLI does not start the app's API clients
+load_dotenv()
+COLLECTION_NAME = os.getenv('COLLECTION_NAME')
+
+VECTORS_FILE = "vectors.npy"
+METADATA_FILE = "metadata.parquet"
+MANIFEST_FILE = "manifest.json"
+
+EXPORT_BATCH_SIZE = int(os.getenv('SNAPSHOT_EXPORT_BATCH', '1000'))
+IMPORT_BATCH_SIZE = int(os.getenv('SNAPSHOT_IMPORT_BATCH', '5000'))
+
+METADATA_SCHEMA = pa.schema(
+    [("id", pa.int64())]
+    + [(name, pa.string()) for name in STRING_FIELDS]
+    + [(name, pa.float32()) for name in FLOAT_FIELDS]
+)
+
+
+# Stream every row of a collection into vectors.npy and typed columns in metadata.parquet
+def export_snapshot(collection_name, snapshot_dir, batch_size=EXPORT_BATCH_SIZE):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    collection = Collection(collection_name)
+    collection.load()
+
+    raw_path = os.path.join(snapshot_dir, VECTORS_FILE + ".part")
+    count = 0
+    # From the schema, so an empty collection still records the dimension a restore needs
+    dim = next(field.params["dim"] for field in collection.schema.fields if field.name == "vector")
+    iterator = collection.query_iterator(
+        batch_size=batch_size,
+        expr="id >= 0",
+        output_fields=["id", "vector"] + SCALAR_FIELDS
+    )
+    with open(raw_path, "wb") as raw, \
+            pq.ParquetWriter(os.path.join(snapshot_dir, METADATA_FILE), METADATA_SCHEMA) as writer:
+        while True:
+            batch = iterator.next()
+            if not batch:
+                iterator.close()
+                break
+            vectors = np.asarray([row["vector"] for row in batch], dtype=np.float32).reshape(len(batch), dim)
+            raw.write(vectors.tobytes())
+            writer.write_table(pa.table(
+                {name: [row[name] for row in batch] for name in METADATA_SCHEMA.names},
+                schema=METADATA_SCHEMA
+            ))
+            count += len(batch)
+            print(f"Exported {count} rows", end="\r", flush=True)
+
+    # Prepend the .npy header now that the row count is known, copying the body in chunks
+    with open(os.path.join(snapshot_dir, VECTORS_FILE), "wb") as out, open(raw_path, "rb") as raw:
+        np.lib.format.write_array_header_1_0(out, {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+            "fortran_order": False,
+            "shape": (count, dim)
+        })
+        shutil.copyfileobj(raw, out, length=16 * 1024 * 1024)
+    os.remove(raw_path)
+
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), "w") as f:
+        json.dump({
+            "collection": collection_name,
+            "embedding_model": model_from_description(collection.description),
+            "count": count,
+            "dim": dim,
+            "created": time.time()
+        }, f, indent=2)
+    return count
+
+
+# Memory-mapped view of a snapshot's vectors, for restores and offline benchmarks
+def load_snapshot_vectors(snapshot_dir):
+    return np.load(os.path.join(snapshot_dir, VECTORS_FILE), mmap_mode="r")
+
+
+# Bulk-load a snapshot into a fresh collection, indexing only after all rows are in
+def import_snapshot(snapshot_dir, collection_name, batch_size=IMPORT_BATCH_SIZE):
+    vectors = load_snapshot_vectors(snapshot_dir)
+    metadata_file = pq.ParquetFile(os.path.join(snapshot_dir, METADATA_FILE))
+    if metadata_file.metadata.num_rows != len(vectors):
+        raise ValueError("Snapshot vectors and metadata have different row counts")
+
+    manifest_path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    model_name = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            model_name = json.load(f).get("embedding_model")
+
+    collection = create_collection(collection_name, dim=vectors.shape[1], model_name=model_name)
+    offset = 0
+    for batch in metadata_file.iter_batches(batch_size=batch_size):
+        records = batch.to_pylist()
+        batch_vectors = np.asarray(vectors[offset:offset + len(records)], dtype=np.float32)
+        # Snapshots taken before the typed schema carry a metadata JSON column instead
+        if "metadata" in batch.schema.names:
+            records = [dict(json.loads(record.pop("metadata") or "{}"), **record) for record in records]
+        collection.insert([
+            make_row(record["id"], vector, record)
+            for record, vector in zip(records, batch_vectors)
+        ])
+        offset += len(records)
+        print(f"Imported {offset}/{len(vectors)} rows", end="\r", flush=True)
+
+    build_indexes(collection)
+    return offset
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a collection snapshot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write a collection to a snapshot directory")
+    export_parser.add_argument("snapshot_dir")
+    export_parser.add_argument("--collection", default=COLLECTION_NAME)
+    export_parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+
+    import_parser = subparsers.add_parser("import", help="Load a snapshot into a new collection")
+    import_parser.add_argument("snapshot_dir")
+    import_parser.add_argument("--collection", required=True, help="Name of the collection to create")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    args = parser.parse_args()
+    connections.connect(uri=os.getenv('URL'), token=os.getenv('TOKEN'))
+    started = time.monotonic()
+    if args.command == "export":
+        count = export_snapshot(args.collection, args.snapshot_dir, args.batch_size)
+        print(f"\nExported {count} rows from {args.collection} to {args.snapshot_dir}", end="")
+    else:
+        count = import_snapshot(args.snapshot_dir, args.collection, args.batch_size)
+        print(f"\nImported {count} rows into {args.collection}", end="")
+    print(f" in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
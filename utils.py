@@ -1,33 +1,145 @@
 import os
+import time
 import uuid
+import threading
+import logging
 from dotenv import load_dotenv
 from twelvelabs import TwelveLabs
-from pymilvus import connections, Collection
+from pymilvus import connections
 import streamlit as st
 from openai import OpenAI
 import numpy as np
+import io
+import html
+from resilience import call_with_resilience, UpstreamError, CircuitOpenError
+from prompt_builder import build_rag_prompt, log_token_usage, CHAT_MODEL
+from search_results import SearchResultSet, rerank_exact
+from sharding import ShardRouter
+from schema import (
+    make_row, model_from_description, CARD_FIELDS, SEARCH_PARAMS, RERANK_OVERFETCH, RERANK_SEARCH_PARAMS
+)
+from metadata_cache import MetadataCache
+from clip_server import clip_service_available, clip_url, prefetch_clips, is_browser_url, is_upload_url, resolve_upload
+from similar_items import SimilarItems
+from video_upload import UploadProgress, create_upload_tasks
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, DOC_FIELDS
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 COLLECTION_NAME = os.getenv('COLLECTION_NAME')
 URL = os.getenv('URL')
 TOKEN = os.getenv('TOKEN')
 TWELVELABS_API_KEY = os.getenv('TWELVELABS_API_KEY')
 
+# Embedding model used when the served collection does not record one
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'Marengo-retrieval-2.7')
+# Seconds a model name read from the served collection is reused, and the timeout for reading it
+MODEL_REFRESH_SECONDS = float(os.getenv('MODEL_REFRESH_SECONDS', '15'))
+MODEL_DESCRIBE_TIMEOUT = float(os.getenv('MODEL_DESCRIBE_TIMEOUT', '2'))
+
+# Clip lengths in seconds for the two indexed resolutions (the API allows 2-10)
+CLIP_LENGTHS = {
+    "coarse": int(os.getenv('COARSE_CLIP_LENGTH', '10')),
+    "fine": int(os.getenv('FINE_CLIP_LENGTH', '2'))
+}
+# Coarse regions refined at the fine level per query
+COARSE_CANDIDATES = int(os.getenv('COARSE_CANDIDATES', '5'))
+# Results a paged visual search can reach; sizes the coarse stage once for every page
+VIDEO_PAGE_DEPTH = int(os.getenv('VIDEO_PAGE_DEPTH', '100'))
+# Products without coarse clips searched by id; more than this and their search is unrestricted
+LEGACY_FILTER_LIMIT = int(os.getenv('LEGACY_FILTER_LIMIT', '1000'))
+# Cut fine segment clips into the clip cache right after ingest
+CLIP_PREPARE_AT_INGEST = os.getenv('CLIP_PREPARE_AT_INGEST', 'false').lower() in ('1', 'true', 'yes')
+# Attributes search callers can filter on; each has a scalar index
+FILTER_FIELDS = ("product_id", "category")
+
 # Initialize connections
 openai_client = OpenAI()
+twelvelabs_client = TwelveLabs(api_key=TWELVELABS_API_KEY)
 connections.connect(uri=URL, token=TOKEN)
-collection = Collection(COLLECTION_NAME)
-collection.load()
+shard_router = ShardRouter.from_env(COLLECTION_NAME, uri=URL, token=TOKEN)
+shard_router.load()
+
+_query_model = {"name": None, "checked_at": 0.0}
+
+
+# Read the model the served collection was embedded with; the warm-up loop calls this each pass
+def refresh_query_model():
+    try:
+        collection = shard_router.shards[0].collection
+        description = collection.describe(timeout=MODEL_DESCRIBE_TIMEOUT).get("description")
+        _query_model["name"] = model_from_description(description) or EMBEDDING_MODEL
+    except Exception as e:
+        logger.warning("Could not read the served embedding model: %s", e)
+        _query_model["name"] = _query_model["name"] or EMBEDDING_MODEL
+    _query_model["checked_at"] = time.monotonic()
+    return _query_model["name"]
+
+
+# Cached model name, re-read at most every MODEL_REFRESH_SECONDS so an alias swap is followed quickly
+def get_query_model():
+    if _query_model["name"] is None or time.monotonic() - _query_model["checked_at"] > MODEL_REFRESH_SECONDS:
+        return refresh_query_model()
+    return _query_model["name"]
+
+
+# Card fields for search hits, fetched by id in bulk and kept in memory
+def fetch_card_fields(row_ids):
+    return shard_router.query(expr=f"id in {list(row_ids)}", output_fields=CARD_FIELDS)
+
+
+metadata_cache = MetadataCache(fetch_card_fields)
+# "More like this" graph built by build_similar_items.py and extended on insert
+similar_items = SimilarItems.load()
+SIMILAR_ITEMS_SHOWN = int(os.getenv('SIMILAR_ITEMS_SHOWN', '3'))
+
+
+# Keyword index over product titles and descriptions, rebuilt by the warm-up loop and extended on insert
+lexical_index = LexicalIndex()
+# Keyword and vector hits considered per ranking before fusing them
+LEXICAL_CANDIDATES = int(os.getenv('LEXICAL_CANDIDATES', '10'))
+RAG_TEXT_DOCS = 2
+RAG_VIDEO_DOCS = 3
+
+
+# Rebuild the keyword index from the text rows of every shard
+def refresh_lexical_index(batch_size=1000):
+    docs = []
+    for shard in shard_router.shards:
+        iterator = shard.collection.query_iterator(
+            batch_size=batch_size,
+            expr='embedding_type == "text"',
+            output_fields=list(DOC_FIELDS)
+        )
+        while True:
+            batch = iterator.next()
+            if not batch:
+                iterator.close()
+                break
+            docs.extend(batch)
+    lexical_index.load(docs)
+    return len(docs)
+
+
+# Related products for a result card, read from the in-memory kNN graph
+def get_similar_items(product_id, limit=SIMILAR_ITEMS_SHOWN):
+    similar_items.reload_if_changed()
+    return similar_items.get(product_id, limit)
 
 
 # Generate text and segmented video embeddings for a product
-def generate_embedding(product_info):
+# Local files (product_info['video_path']) are streamed to the embed task API; pass
+# video_tasks when the uploads were already started, e.g. by a bulk ingest
+def generate_embedding(product_info, model_name=None, clip_lengths=None, video_tasks=None):
     try:
         st.write("Starting embedding generation process...")
         st.write(f"Processing product: {product_info['title']}")
         
+        model_name = model_name or get_query_model()
+        clip_lengths = clip_lengths or CLIP_LENGTHS
         twelvelabs_client = TwelveLabs(api_key=TWELVELABS_API_KEY)
         st.write("TwelveLabs client initialized successfully")
         
@@ -40,49 +152,70 @@ def generate_embedding(product_info):
         st.write(f"Generating embedding for text: {text}")
         
         text_embedding = twelvelabs_client.embed.create(
-            model_name="Marengo-retrieval-2.7",
+            model_name=model_name,
             text=text
         ).text_embedding.segments[0].embeddings_float
         st.write("Text embedding generated successfully")
 
         
-        # Create and wait for video embedding task
-        st.write("Creating video embedding task...")
-        video_task = twelvelabs_client.embed.task.create(
-            model_name="Marengo-retrieval-2.7",
-            video_url=product_info['video_url'],
-            video_clip_length=6
-        )
+        # Create both resolution tasks up front so TwelveLabs processes them in parallel
+        st.write("Creating coarse and fine video embedding tasks...")
+        # Stored products name their uploaded video by key, e.g. when a re-index embeds them again
+        video_path = product_info.get('video_path') or resolve_upload(product_info['video_url'])
+        if video_tasks is None and video_path:
+            progress_bar = st.progress(0.0, text="Starting upload...")
+            uploaded, failed = create_upload_tasks(
+                twelvelabs_client, model_name, [video_path], clip_lengths, UploadProgress(),
+                on_progress=lambda progress: progress_bar.progress(min(progress.fraction(), 1.0),
+                                                                   text=progress.summary())
+            )
+            if failed:
+                raise Exception(failed[video_path])
+            video_tasks = uploaded[video_path]
+        elif video_tasks is None:
+            video_tasks = {
+                resolution: twelvelabs_client.embed.task.create(
+                    model_name=model_name,
+                    video_url=product_info['video_url'],
+                    video_clip_length=clip_length
+                )
+                for resolution, clip_length in clip_lengths.items()
+            }
         
         def on_task_update(task):
             st.write(f"Video processing status: {task.status}")
         
         st.write("Waiting for video processing to complete...")
-        video_task.wait_for_done(sleep_interval=2, callback=on_task_update)
-        
-        # Retrieve segmented video embeddings
-        video_task = video_task.retrieve()
-        if not video_task.video_embedding or not video_task.video_embedding.segments:
-            raise Exception("Failed to retrieve video embeddings")
-        
-        video_segments = video_task.video_embedding.segments
-        st.write(f"Retrieved {len(video_segments)} video segments")
-        
-        video_embeddings = []
-        for segment in video_segments:
-            video_embeddings.append({
-                'embedding': segment.embeddings_float,
-                'metadata': {
-                    'scope': 'clip',
-                    'start_time': segment.start_offset_sec,
-                    'end_time': segment.end_offset_sec,
-                    'video_url': product_info['video_url']
+        segments_by_resolution = {}
+        for resolution, video_task in video_tasks.items():
+            video_task.wait_for_done(sleep_interval=2, callback=on_task_update)
+            
+            # Retrieve segmented video embeddings
+            video_task = video_task.retrieve()
+            if not video_task.video_embedding or not video_task.video_embedding.segments:
+                raise Exception(f"Failed to retrieve {resolution} video embeddings")
+            
+            video_segments = video_task.video_embedding.segments
+            st.write(f"Retrieved {len(video_segments)} {resolution} video segments")
+            
+            segments_by_resolution[resolution] = [
+                {
+                    'embedding': segment.embeddings_float,
+                    'metadata': {
+                        'scope': 'clip',
+                        'resolution': resolution,
+                        'start_time': segment.start_offset_sec,
+                        'end_time': segment.end_offset_sec,
+                        'video_url': product_info['video_url']
+                    }
                 }
-            })
+                for segment in video_segments
+            ]
         
         return {
             'text_embedding': text_embedding,
-            'video_embeddings': video_embeddings
+            'video_embeddings': segments_by_resolution['fine'],
+            'coarse_video_embeddings': segments_by_resolution['coarse']
         }, None
         
     except Exception as e:
@@ -92,239 +225,358 @@ def generate_embedding(product_info):
 
 
 # Insert text and all video segment embeddings
-def insert_embeddings(embeddings_data, product_info):
+def insert_embeddings(embeddings_data, product_info, target_collection=None):
     try:
-        metadata = {
+        attributes = {
             "product_id": product_info['product_id'],
             "title": product_info['title'],
             "description": product_info['desc'],
             "video_url": product_info['video_url'],
-            "link": product_info['link']
+            "link": product_info['link'],
+            "category": product_info.get('category', ''),
+            "region": product_info.get('region', '')
         }
+
+        # Every row of a product lives on the same shard, unless a re-index names the target
+        collection = target_collection or shard_router.route(product_info).collection
+
+        def insert_rows(embedding_type, segments):
+            rows = [
+                make_row(
+                    int(uuid.uuid4().int & (1<<63)-1),
+                    segment['embedding'],
+                    {**attributes, **segment['metadata'], "embedding_type": embedding_type}
+                )
+                for segment in segments
+            ]
+            if rows:
+                collection.insert(rows)
+                for row in rows:
+                    metadata_cache.put(row["id"], {field: row[field] for field in CARD_FIELDS})
+            return rows
         
         # Insert text embedding
-        text_entry = {
-            "id": int(uuid.uuid4().int & (1<<63)-1),
-            "vector": embeddings_data['text_embedding'],
-            "metadata": metadata,
-            "embedding_type": "text"
-        }
-        collection.insert([text_entry])
+        insert_rows("text", [{'embedding': embeddings_data['text_embedding'], 'metadata': {}}])
         st.write("Text embedding inserted successfully")
         
         # Insert each video segment embedding
-        for video_segment in embeddings_data['video_embeddings']:
-            video_entry = {
-                "id": int(uuid.uuid4().int & (1<<63)-1),
-                "vector": video_segment['embedding'],
-                "metadata": {**metadata, **video_segment['metadata']},
-                "embedding_type": "video"
-            }
-            collection.insert([video_entry])
-        
+        insert_rows("video", embeddings_data['video_embeddings'])
         st.write(f"Inserted {len(embeddings_data['video_embeddings'])} video segment embeddings")
-        return True
-        
+        if CLIP_PREPARE_AT_INGEST:
+            prefetch_clips(product_info['video_url'], [
+                (segment['metadata']['start_time'], segment['metadata']['end_time'])
+                for segment in embeddings_data['video_embeddings']
+            ])
+
+        # Insert the long coarse clips used to localize a search before refining
+        coarse_rows = insert_rows("video_coarse", embeddings_data.get('coarse_video_embeddings', []))
+        if coarse_rows:
+            st.write(f"Inserted {len(coarse_rows)} coarse video segment embeddings")
     except Exception as e:
         st.error(f"Error inserting embeddings: {str(e)}")
         return False
 
+    # Re-index runs write a shadow collection whose vectors may come from another model
+    if target_collection is None:
+        lexical_index.add(attributes)
+        try:
+            similar_items.append(product_info['product_id'], product_info['title'], embeddings_data['text_embedding'])
+        except Exception as e:
+            st.warning(f"Could not update similar items: {str(e)}")
+    return True
 
-# Search for similar video segments using image query
-def search_similar_videos(image_file, top_k=5):
-    
-    try:
-        twelvelabs_client = TwelveLabs(api_key=TWELVELABS_API_KEY)
-        image_embedding = twelvelabs_client.embed.create(
-            model_name="Marengo-retrieval-2.7",
-            image_file=image_file
+
+# "rerank" runs a cheaper ANN pass, over-fetches candidates and reorders them by exact cosine
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'ann')
+
+
+# On IVF_FLAT the index scores are already exact, so reranking only adds vector traffic
+def check_rerank_index():
+    if SEARCH_MODE != "rerank":
+        return
+    for index in shard_router.shards[0].collection.indexes:
+        if index.field_name == "vector" and index.params.get("index_type") == "IVF_FLAT":
+            logger.warning("SEARCH_MODE=rerank on an IVF_FLAT index gains nothing; "
+                           "rebuild the collection with VECTOR_INDEX_TYPE=IVF_SQ8")
+
+
+try:
+    check_rerank_index()
+except Exception as e:
+    logger.warning("Could not read the vector index type: %s", e)
+
+
+# Generate an embedding for a single image query
+def embed_image(image_file, dependency="twelvelabs_embed"):
+    # Read once so hedged and retried attempts each upload from a fresh buffer
+    if hasattr(image_file, "getvalue"):
+        image_bytes = image_file.getvalue()
+    else:
+        image_bytes = image_file.read()
+
+    # Resolved before the call, so retries and hedges do not repeat the lookup against Milvus
+    model_name = get_query_model()
+
+    def create():
+        return twelvelabs_client.embed.create(
+            model_name=model_name,
+            image_file=io.BytesIO(image_bytes)
         ).image_embedding.segments[0].embeddings_float
-        
-        search_params = {
-            "metric_type": "COSINE",
-            "params": {
-                "nprobe": 1024,
-                "ef": 64
-            }
-        }
-        
-        results = collection.search(
-            data=[image_embedding],
-            anns_field="vector",
-            param=search_params,
-            limit=top_k,
-            expr="embedding_type == 'video'",
-            output_fields=["metadata"]
+
+    return call_with_resilience(dependency, create)
+
+
+# Generate an embedding for a text query
+def embed_text(text):
+    # Resolved before the call, so retries and hedges do not repeat the lookup against Milvus
+    model_name = get_query_model()
+
+    def create():
+        return twelvelabs_client.embed.create(
+            model_name=model_name,
+            text=text
+        ).text_embedding.segments[0].embeddings_float
+
+    return call_with_resilience("twelvelabs_embed", create)
+
+
+# Scatter a search over every shard that can hold matches and merge the top-k
+def search_collection(filters=None, **search_kwargs):
+    return shard_router.search(filters=filters, **search_kwargs)
+
+
+# Quote a string literal for a Milvus filter expression
+def quote_expr_value(value):
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+# Filter expression for an embedding type plus optional attribute filters
+def build_filter_expr(embedding_type, filters=None, extra_expr=None):
+    parts = [f"embedding_type == {quote_expr_value(embedding_type)}"]
+    for field in FILTER_FIELDS:
+        if filters and filters.get(field):
+            parts.append(f"{field} == {quote_expr_value(filters[field])}")
+    if extra_expr:
+        parts.append(f"({extra_expr})")
+    return " and ".join(parts)
+
+
+# Search one embedding type for one or more query vectors in a single request
+def search_vectors(vectors, top_k=5, embedding_type="video", extra_expr=None, offset=0, filters=None):
+    if SEARCH_MODE == "rerank":
+        return search_vectors_reranked(vectors, top_k, embedding_type, extra_expr, offset, filters)
+
+    # Only ids and scores come back; card fields are filled from the metadata cache
+    results = search_collection(
+        filters=filters,
+        data=vectors,
+        anns_field="vector",
+        param=SEARCH_PARAMS,
+        limit=top_k,
+        offset=offset,
+        expr=build_filter_expr(embedding_type, filters, extra_expr),
+        output_fields=[]
+    )
+    metadata = metadata_cache.get_many([hit.id for hits in results for hit in hits])
+    return [SearchResultSet.from_hits(hits, embedding_type, metadata) for hits in results]
+
+
+# Cheap ANN over-fetch, then exact cosine over the candidate vectors in NumPy
+def search_vectors_reranked(vectors, top_k=5, embedding_type="video", extra_expr=None, offset=0, filters=None):
+    results = search_collection(
+        filters=filters,
+        data=vectors,
+        anns_field="vector",
+        param=RERANK_SEARCH_PARAMS,
+        limit=(offset + top_k) * RERANK_OVERFETCH,
+        expr=build_filter_expr(embedding_type, filters, extra_expr),
+        output_fields=["vector"]
+    )
+    reranked = [
+        rerank_exact(
+            vector,
+            [hit.id for hit in hits],
+            [hit.entity.get("vector") for hit in hits],
+            top_k,
+            offset
         )
+        for vector, hits in zip(vectors, results)
+    ]
+    metadata = metadata_cache.get_many([row_id for ids, _ in reranked for row_id in ids.tolist()])
+    return [SearchResultSet.from_arrays(ids, scores, embedding_type, metadata) for ids, scores in reranked]
 
-        search_results = []
-        for hits in results:
-            for hit in hits:
-                metadata = hit.metadata
-                # Convert score from [-1,1] to [0,100] range
-                similarity = round((hit.score + 1) * 50, 2)
-                similarity = max(0, min(100, similarity))
-                
-                search_results.append({
-                    'Title': metadata.get('title', ''),
-                    'Description': metadata.get('description', ''),
-                    'Link': metadata.get('link', ''),
-                    'Start Time': f"{metadata.get('start_time', 0):.1f}s",
-                    'End Time': f"{metadata.get('end_time', 0):.1f}s",
-                    'Video URL': metadata.get('video_url', ''),
-                    'Similarity': f"{similarity}%",
-                    'Raw Score': hit.score
-                })
-        
-        # Sort by similarity score in descending order
-        search_results.sort(key=lambda x: float(x['Similarity'].rstrip('%')), reverse=True)
-        
-        return search_results
-        
+
+# Products with a text row but no coarse clips, i.e. indexed before coarse clips existed
+def find_products_without_coarse(batch_size=1000):
+    products, covered = set(), set()
+    for shard in shard_router.shards:
+        for embedding_type, found in (("text", products), ("video_coarse", covered)):
+            iterator = shard.collection.query_iterator(
+                batch_size=batch_size,
+                expr=f"embedding_type == {quote_expr_value(embedding_type)}",
+                output_fields=["product_id"]
+            )
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    iterator.close()
+                    break
+                found.update(row["product_id"] for row in batch)
+    return products - covered
+
+
+# Refreshed by the warm-up loop; None until first computed, empty once backfill_coarse.py has run
+coarse_coverage = {"missing": None}
+_coverage_lock = threading.Lock()
+
+
+def refresh_coarse_coverage():
+    missing = frozenset(find_products_without_coarse())
+    coarse_coverage["missing"] = missing
+    return len(missing)
+
+
+# The coverage set, computed by the first search that needs it if warm-up has not filled it yet
+def products_without_coarse():
+    if coarse_coverage["missing"] is None:
+        with _coverage_lock:
+            if coarse_coverage["missing"] is None:
+                refresh_coarse_coverage()
+    return coarse_coverage["missing"]
+
+
+# Fine-clip filter for a query: the best regions on long coarse clips, plus products that have no
+# coarse clips. Deeper result lists widen the coarse stage, since each coarse clip holds only a few
+# fine clips. None means every fine clip is searched.
+def coarse_window_expr(vector, depth, filters=None):
+    fine_per_coarse = max(CLIP_LENGTHS["coarse"] // CLIP_LENGTHS["fine"], 1)
+    coarse_k = max(COARSE_CANDIDATES, 2 * -(-depth // fine_per_coarse))
+    coarse = search_vectors([vector], top_k=coarse_k, embedding_type="video_coarse", filters=filters)[0]
+    if not len(coarse):
+        return None
+    windows = " or ".join(
+        f'(video_url == {quote_expr_value(hit.video_url)} '
+        f'and start_time >= {hit.start_time} and start_time < {hit.end_time})'
+        for hit in coarse
+    )
+    try:
+        missing = products_without_coarse()
     except Exception as e:
+        logger.warning("Coarse coverage unavailable: %s", e)
         return None
+    if not missing:
+        return windows
+    # Beyond this many ids the restriction costs more than searching every fine clip
+    if len(missing) > LEGACY_FILTER_LIMIT:
+        return None
+    ids = ", ".join(quote_expr_value(product_id) for product_id in sorted(missing))
+    return f"{windows} or product_id in [{ids}]"
 
 
-# Get response using text embeddings to get multimodal result
-def get_rag_response(question):
-    try:
-        # Initialize TwelveLabs client
-        twelvelabs_client = TwelveLabs(api_key=TWELVELABS_API_KEY)
-        
+# Rank fine clips inside the coarse windows, falling back to every fine clip when they hold too few
+def search_video_segments(vector, top_k=5, filters=None):
+    return search_video_first_page(vector, top_k, top_k, filters)[0]
+
+
+# First page of a video search and the fine-clip filter later pages reuse. depth sizes the coarse
+# stage for every page the caller may ask for, so paging needs no further coarse search.
+def search_video_first_page(vector, page_size, depth, filters=None):
+    window_expr = coarse_window_expr(vector, max(depth, page_size), filters)
+    page = search_vectors([vector], top_k=page_size, embedding_type="video", extra_expr=window_expr, filters=filters)[0]
+    if window_expr is not None and len(page) < page_size:
+        window_expr = None
+        page = search_vectors([vector], top_k=page_size, embedding_type="video", filters=filters)[0]
+    return page, window_expr
+
+
+# Next page of the same ranking: one ANN lookup at the next offset under the stored filter
+def search_video_page(vector, page_size, cursor, window_expr, filters=None):
+    page = search_vectors([vector], top_k=page_size, embedding_type="video", extra_expr=window_expr,
+                          offset=cursor, filters=filters)[0]
+    return page, (cursor + page_size if len(page) == page_size else None)
+
+
+# Retrieval and completion without Streamlit calls, so background warm-up can run it.
+# Errors are raised; degraded-mode notes are returned under "warnings".
+def answer_question(question, filters=None):
+    warnings = []
+    keyword_docs = lexical_index.to_sources(
+        lexical_index.search(question, top_k=LEXICAL_CANDIDATES, filters=filters)
+    )
+    question_embedding = None
+    # Product ids and rare keywords are answered from the local index without an embed call
+    if not (keyword_docs and lexical_index.is_keyword_query(question)):
         # Generate embedding for the question with fashion context
         question_with_context = f"fashion product: {question}"
-        question_embedding = twelvelabs_client.embed.create(
-            model_name="Marengo-retrieval-2.7",
-            text=question_with_context
-        ).text_embedding.segments[0].embeddings_float
-        
-        search_params = {
-            "metric_type": "COSINE",
-            "params": {
-                "nprobe": 1024,
-                "ef": 64
-            }
-        }
-        
-        # Search for relevant text embeddings
-        text_results = collection.search(
-            data=[question_embedding],
-            anns_field="vector",
-            param=search_params,
-            limit=2,  # Get top 2 text matches
-            expr="embedding_type == 'text'",
-            output_fields=["metadata"]
-        )
-        
-        # Search for relevant video segments
-        video_results = collection.search(
-            data=[question_embedding],
-            anns_field="vector",
-            param=search_params,
-            limit=3,  # Get top 3 video segments
-            expr="embedding_type == 'video'",
-            output_fields=["metadata"]
-        )
+        try:
+            question_embedding = embed_text(question_with_context)
+        except UpstreamError as e:
+            if not keyword_docs:
+                raise
+            warnings.append(f"Semantic search is degraded, showing keyword matches: {str(e)}")
 
-        # Process text results
-        text_docs = []
-        for hits in text_results:
-            for hit in hits:
-                metadata = hit.metadata
-                similarity = round((hit.score + 1) * 50, 2)
-                similarity = max(0, min(100, similarity))
-                
-                text_docs.append({
-                    "title": metadata.get('title', 'Untitled'),
-                    "description": metadata.get('description', 'No description available'),
-                    "product_id": metadata.get('product_id', ''),
-                    "video_url": metadata.get('video_url', ''),
-                    "link": metadata.get('link', ''),
-                    "similarity": similarity,
-                    "raw_score": hit.score,
-                    "type": "text"
-                })
-
-        # Process video results
+    if question_embedding is None:
+        text_docs = keyword_docs[:RAG_TEXT_DOCS]
         video_docs = []
-        for hits in video_results:
-            for hit in hits:
-                metadata = hit.metadata
-                similarity = round((hit.score + 1) * 50, 2)
-                similarity = max(0, min(100, similarity))
-                
-                video_docs.append({
-                    "title": metadata.get('title', 'Untitled'),
-                    "description": metadata.get('description', 'No description available'),
-                    "product_id": metadata.get('product_id', ''),
-                    "video_url": metadata.get('video_url', ''),
-                    "link": metadata.get('link', ''),
-                    "similarity": similarity,
-                    "raw_score": hit.score,
-                    "start_time": metadata.get('start_time', 0),
-                    "end_time": metadata.get('end_time', 0),
-                    "type": "video"
-                })
-
-        if not text_docs and not video_docs:
-            return {
-                "response": "I couldn't find any matching products. Try describing what you're looking for differently.",
-                "metadata": None
-            }
+    else:
+        # Top 2 product descriptions, fused with keyword hits, and top 3 video segments
+        text_docs = search_vectors(
+            [question_embedding], top_k=LEXICAL_CANDIDATES if keyword_docs else RAG_TEXT_DOCS,
+            embedding_type="text", filters=filters
+        )[0].to_sources()
+        if keyword_docs:
+            text_docs = reciprocal_rank_fusion([text_docs, keyword_docs], top_k=RAG_TEXT_DOCS)
+        video_docs = search_video_segments(question_embedding, top_k=RAG_VIDEO_DOCS, filters=filters).to_sources()
 
-        # Create context from text results only for LLM
-        text_context = "\n\n".join([
-            f"Product: {doc['title']}\nDescription: {doc['description']}\nLink: {doc['link']}"
-            for doc in text_docs
-        ])
-
-        # Create messages for chat completion
-        messages = [
-            {
-                "role": "system",
-                "content": """You are a professional fashion advisor and AI shopping assistant.
-                Organize your response in the following format:
-
-                First, provide a brief, direct answer to the user's query
-                Then, describe any relevant products found that match their request, including:
-                   - Product name and key features
-                   - Why this product matches their needs
-                   - Style suggestions for how to wear or use the item
-                Finally, provide any additional style advice or recommendations
-                
-                Keep your response engaging and natural while maintaining this clear structure.
-                Focus on being helpful and specific rather than promotional."""
-            },
-            {
-                "role": "user",
-                "content": f"""Query: {question}
-
-Available Products:
-{text_context}
-
-Please provide fashion advice and product recommendations based on these options."""
-            }
-        ]
-
-        # Get response from OpenAI
-        chat_response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=500
-        )
+    if not text_docs and not video_docs:
+        return {
+            "response": "I couldn't find any matching products. Try describing what you're looking for differently.",
+            "metadata": None,
+            "warnings": warnings
+        }
+
+    # Build a deduplicated, token-budgeted prompt from text and video hits
+    prompt = build_rag_prompt(question, text_docs, video_docs)
+
+    # Get response from OpenAI
+    chat_response = call_with_resilience(
+        "openai_completion",
+        openai_client.chat.completions.create,
+        model=CHAT_MODEL,
+        messages=prompt["messages"],
+        temperature=0.7,
+        max_tokens=prompt["max_tokens"]
+    )
+    log_token_usage(prompt, chat_response)
+
+    # Format and return response
+    return {
+        "response": chat_response.choices[0].message.content,
+        "metadata": {
+            "sources": text_docs + video_docs,
+            "total_sources": len(text_docs) + len(video_docs),
+            "text_sources": len(text_docs),
+            "video_sources": len(video_docs)
+        },
+        "warnings": warnings
+    }
 
-        # Format and return response
+
+# Get response using text embeddings to get multimodal result
+def get_rag_response(question, filters=None):
+    try:
+        response = answer_question(question, filters)
+        for warning in response.pop("warnings"):
+            st.warning(warning)
+        return response
+
+    except CircuitOpenError as e:
+        st.warning(f"Search is degraded: {str(e)}")
         return {
-            "response": chat_response.choices[0].message.content,
-            "metadata": {
-                "sources": text_docs + video_docs,
-                "total_sources": len(text_docs) + len(video_docs),
-                "text_sources": len(text_docs),
-                "video_sources": len(video_docs)
-            }
+            "response": "Our product search is temporarily unavailable. Please try again in a moment.",
+            "metadata": None
         }
-    
+
     except Exception as e:
         st.error(f"Error in multimodal RAG: {str(e)}")
         return {
@@ -372,6 +624,22 @@ def create_video_embed(video_url, start_time=0, end_time=0):
                     allowfullscreen>
                 </iframe>
             """
+        elif platform == 'direct' and clip_service_available() and end_time and (
+                is_browser_url(video_url) or is_upload_url(video_url)):
+            # Only the matched segment is fetched, from the local clip cache
+            return f"""
+                <video 
+                    width="100%" 
+                    height="315" 
+                    controls 
+                    preload="metadata">
+                    <source src="{html.escape(clip_url(video_url, start_time, end_time))}" type="video/mp4">
+                    Your browser does not support the video tag.
+                </video>
+            """
+        elif platform == 'direct' and not is_browser_url(video_url):
+            # Uploaded videos are only served as clips; their server path never reaches the page
+            return "<p>Video preview unavailable.</p>"
         elif platform == 'direct':
             return f"""
                 <video 
@@ -0,0 +1,153 @@
+import os
+import re
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from clip_server import CLIP_LOCAL_ROOT
+
+# Embed-task uploads in flight at once; each file is sent once per clip resolution
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', '4'))
+# Seconds between progress refreshes while uploads run
+UPLOAD_PROGRESS_INTERVAL = float(os.getenv('UPLOAD_PROGRESS_INTERVAL', '0.5'))
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.webm', '.mkv', '.avi')
+
+
+# Bytes sent per upload, shared between the upload threads and the thread rendering progress
+class UploadProgress:
+    def __init__(self):
+        self.sent = {}
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def start(self, key, total):
+        with self.lock:
+            self.sent[key] = 0
+            self.totals[key] = total
+
+    def update(self, key, sent):
+        with self.lock:
+            self.sent[key] = sent
+
+    def fraction(self):
+        with self.lock:
+            total = sum(self.totals.values())
+            return sum(self.sent.values()) / total if total else 0.0
+
+    def summary(self):
+        with self.lock:
+            sent, total = sum(self.sent.values()), sum(self.totals.values())
+        # Each file is sent once per clip resolution, so the total counts it that many times
+        return (f"Uploaded {sent / 1024 ** 2:.1f} of {total / 1024 ** 2:.1f} MB "
+                f"({len(self.totals)} uploads, one per file and clip resolution)")
+
+
+# Read-only file the HTTP client streams from, counting bytes as they leave
+class ProgressFile:
+    def __init__(self, path, progress, key):
+        self.file = open(path, "rb")
+        self.name = self.file.name
+        self.progress = progress
+        self.key = key
+        self.sent = 0
+
+    # fileno lets httpx size the multipart body from fstat instead of buffering it
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        chunk = self.file.read(size)
+        self.sent += len(chunk)
+        self.progress.update(self.key, self.sent)
+        return chunk
+
+    # A retried request rewinds the stream, so the count restarts with it
+    def seek(self, offset, whence=os.SEEK_SET):
+        position = self.file.seek(offset, whence)
+        self.sent = position
+        self.progress.update(self.key, position)
+        return position
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def safe_file_name(name):
+    base = os.path.basename(name or "upload.mp4")
+    return re.sub(r"[^A-Za-z0-9._-]", "_", base) or "upload.mp4"
+
+
+# Copy a browser upload under CLIP_LOCAL_ROOT in chunks so the clip server can serve its segments
+def save_uploaded_video(uploaded_file):
+    os.makedirs(CLIP_LOCAL_ROOT, exist_ok=True)
+    path = os.path.join(CLIP_LOCAL_ROOT, f"{uuid.uuid4().hex[:12]}_{safe_file_name(uploaded_file.name)}")
+    uploaded_file.seek(0)
+    with open(path + ".part", "wb") as out:
+        shutil.copyfileobj(uploaded_file, out, length=COPY_CHUNK_SIZE)
+    os.replace(path + ".part", path)
+    return path
+
+
+# Place a server-side video under CLIP_LOCAL_ROOT, linking instead of copying when possible
+def stage_local_video(path):
+    path = os.path.abspath(path)
+    if not os.path.isfile(path):
+        raise ValueError(f"Video file not found: {path}")
+    if not path.lower().endswith(VIDEO_EXTENSIONS):
+        raise ValueError(f"Unsupported video file type: {path}")
+    if path.startswith(CLIP_LOCAL_ROOT + os.sep):
+        return path
+    os.makedirs(CLIP_LOCAL_ROOT, exist_ok=True)
+    staged = os.path.join(CLIP_LOCAL_ROOT, f"{uuid.uuid4().hex[:12]}_{safe_file_name(path)}")
+    try:
+        os.link(path, staged)
+    except OSError:
+        shutil.copyfile(path, staged)
+    return staged
+
+
+# Create one embed task per (file, resolution), streaming every upload from disk in parallel.
+# Returns the tasks of files whose uploads all succeeded and the first error of each file that failed.
+def create_upload_tasks(client, model_name, video_paths, clip_lengths, progress,
+                        max_workers=UPLOAD_CONCURRENCY, on_progress=None):
+    def create_task(path, resolution, clip_length):
+        video_file = ProgressFile(path, progress, (path, resolution))
+        try:
+            return client.embed.task.create(
+                model_name=model_name,
+                video_file=video_file,
+                video_clip_length=clip_length
+            )
+        finally:
+            video_file.close()
+
+    # Register every upload first so the overall fraction does not jump as workers start
+    for path in video_paths:
+        for resolution in clip_lengths:
+            progress.start((path, resolution), os.path.getsize(path))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload") as executor:
+        futures = {
+            (path, resolution): executor.submit(create_task, path, resolution, clip_length)
+            for path in video_paths
+            for resolution, clip_length in clip_lengths.items()
+        }
+        # Progress is reported from the calling thread, where Streamlit elements can be updated
+        pending = set(futures.values())
+        while pending:
+            _, pending = wait(pending, timeout=UPLOAD_PROGRESS_INTERVAL)
+            if on_progress:
+                on_progress(progress)
+
+    tasks = {path: {} for path in video_paths}
+    failed = {}
+    for (path, resolution), future in futures.items():
+        try:
+            tasks[path][resolution] = future.result()
+        except Exception as e:
+            failed.setdefault(path, f"{resolution} upload failed: {e}")
+    return {path: path_tasks for path, path_tasks in tasks.items() if path not in failed}, failed
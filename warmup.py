@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from utils import (
+    shard_router, answer_question, refresh_lexical_index, refresh_coarse_coverage, refresh_query_model,
+    MODEL_REFRESH_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Queries offered as suggestion buttons; override with a "|" separated WARMUP_QUERIES
+DEFAULT_SUGGESTED_QUERIES = [
+    "Show me black dresses for a party",
+    "I'm looking for men's black t-shirts",
+    "What are the latest bridal collection designs?",
+    "Find me a casual black dress",
+    "Show me t-shirts for men",
+    "Can you suggest bridal wear?"
+]
+SUGGESTED_QUERIES = [q.strip() for q in os.getenv('WARMUP_QUERIES', '').split('|') if q.strip()] \
+    or DEFAULT_SUGGESTED_QUERIES
+
+# Most frequent logged chat queries precomputed alongside the suggestions
+WARMUP_TOP_LOGGED = int(os.getenv('WARMUP_TOP_LOGGED', '10'))
+WARMUP_REFRESH_SECONDS = int(os.getenv('WARMUP_REFRESH_SECONDS', '3600'))
+# Query counts persisted between restarts; only the most frequent entries are kept
+QUERY_LOG_PATH = os.getenv('QUERY_LOG_PATH', 'query_counts.json')
+QUERY_LOG_MAX_ENTRIES = int(os.getenv('QUERY_LOG_MAX_ENTRIES', '1000'))
+QUERY_LOG_FLUSH_SECONDS = int(os.getenv('QUERY_LOG_FLUSH_SECONDS', '60'))
+
+_precomputed = {}
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+# Counts since the last flush, and the merged totals the top-logged list is read from
+_pending_counts = Counter()
+_query_counts = Counter()
+_originals = {}
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+# Count a chat query in memory; the warm-up loop flushes counts to disk
+def log_query(query):
+    key = normalize_query(query)
+    with _log_lock:
+        _pending_counts[key] += 1
+        _originals.setdefault(key, query)
+
+
+def _read_counts():
+    try:
+        with open(QUERY_LOG_PATH) as f:
+            stored = json.load(f)
+        return Counter(stored.get("counts", {})), stored.get("originals", {})
+    except (OSError, ValueError, AttributeError):
+        return Counter(), {}
+
+
+# Merge pending counts into the file, keeping it to the most frequent queries
+def flush_query_log(max_entries=QUERY_LOG_MAX_ENTRIES):
+    with _log_lock:
+        pending = Counter(_pending_counts)
+        _pending_counts.clear()
+        counts, originals = _read_counts()
+        counts.update(pending)
+        kept = dict(counts.most_common(max_entries))
+        originals = {key: originals.get(key) or _originals.get(key, key) for key in kept}
+        try:
+            with open(QUERY_LOG_PATH + ".tmp", "w") as f:
+                json.dump({"counts": kept, "originals": originals}, f)
+            os.replace(QUERY_LOG_PATH + ".tmp", QUERY_LOG_PATH)
+        except OSError as e:
+            logger.warning("Could not save query counts: %s", e)
+            _pending_counts.update(pending)
+        _query_counts.clear()
+        _query_counts.update(kept)
+        _originals.clear()
+        _originals.update(originals)
+
+
+def top_logged_queries(limit=WARMUP_TOP_LOGGED):
+    if limit <= 0:
+        return []
+    with _log_lock:
+        counts = _query_counts + _pending_counts
+        return [_originals.get(key, key) for key, _ in counts.most_common(limit)]
+
+
+# Answer stored for a query at warm-up, or None if it was not precomputed
+def get_precomputed_response(query):
+    with _lock:
+        return _precomputed.get(normalize_query(query))
+
+
+# Run retrieval and completion for every canned and top-logged query
+def precompute_responses():
+    global _precomputed
+    queries = []
+    seen = set()
+    for query in SUGGESTED_QUERIES + top_logged_queries():
+        key = normalize_query(query)
+        if key not in seen:
+            seen.add(key)
+            queries.append(query)
+
+    # Built fresh each pass, so queries that left the list or now fail stop being served
+    fresh = {}
+    for query in queries:
+        try:
+            response = answer_question(query)
+        except Exception as e:
+            logger.warning("Warm-up answer for %r failed: %s", query, e)
+            continue
+        # Empty or degraded answers are retried on the next refresh instead of being served
+        if response.get("metadata") and not response.pop("warnings"):
+            fresh[normalize_query(query)] = response
+    with _lock:
+        _precomputed = fresh
+    logger.info("Precomputed %d/%d warm-up answers", len(fresh), len(queries))
+
+
+# Load the collections and fill the precomputed answers, then refresh on a schedule
+def _warmup_loop():
+    started = time.monotonic()
+    try:
+        shard_router.load()
+    except Exception as e:
+        logger.warning("Collection warm-up failed: %s", e)
+    flush_query_log()
+    while True:
+        refresh_query_model()
+        try:
+            logger.info("Keyword index holds %d products", refresh_lexical_index())
+        except Exception as e:
+            logger.warning("Keyword index refresh failed: %s", e)
+        try:
+            missing = refresh_coarse_coverage()
+            if missing:
+                logger.warning("%d products have no coarse clips; run backfill_coarse.py", missing)
+        except Exception as e:
+            logger.warning("Coarse coverage refresh failed: %s", e)
+        try:
+            precompute_responses()
+        except Exception as e:
+            logger.warning("Warm-up precompute failed: %s", e)
+        logger.info("Warm-up pass finished in %.1fs", time.monotonic() - started)
+        next_pass = time.monotonic() + WARMUP_REFRESH_SECONDS
+        next_flush = time.monotonic() + QUERY_LOG_FLUSH_SECONDS
+        while time.monotonic() < next_pass:
+            time.sleep(min(MODEL_REFRESH_SECONDS, max(next_pass - time.monotonic(), 0)))
+            # Keeps the cached model fresh so queries rarely pay for the lookup themselves
+            refresh_query_model()
+            if time.monotonic() >= next_flush:
+                flush_query_log()
+                next_flush = time.monotonic() + QUERY_LOG_FLUSH_SECONDS
+        started = time.monotonic()
+
+
+# Start the background warm-up thread; call once per process
+def start_warmup():
+    thread = threading.Thread(target=_warmup_loop, name="warmup", daemon=True)
+    thread.start()
+    return thread